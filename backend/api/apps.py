@@ -5,3 +5,6 @@ class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
     verbose_name = 'API для проекта Foodgram'
+
+    def ready(self):
+        from . import signals  # noqa F401
@@ -0,0 +1,219 @@
+""" Асинхронные обработчики чтения рецептов, тегов и ингредиентов.
+
+Подключаются в режиме ASGI (ASYNC_READ_VIEWS) перед маршрутами DefaultRouter
+для GET-запросов списка и карточки рецепта, списков тегов и ингредиентов.
+
+Ответ из кеша (анонимные ответы, справочники) отдается без обращения к БД
+и без занятого потока. Для остальных запросов аутентификация, права,
+фильтры и разбор параметров выполняются кодом DRF в потоке (sync_to_async),
+основные запросы к БД - асинхронным ORM (acount, afirst, async for),
+сериализация - в цикле событий по уже загруженным данным. Остальные
+методы и случаи, которые обработчик не поддерживает (курсорная пагинация,
+не-JSON формат, ошибки), передаются стандартному представлению ViewSet
+в потоке, поэтому ответы совпадают с ответами в режиме WSGI.
+"""
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, HttpResponse
+from rest_framework.exceptions import APIException # noqa I005
+from rest_framework.renderers import JSONRenderer # noqa I005
+from rest_framework.utils.urls import (remove_query_param, # noqa I005
+                                       replace_query_param) # noqa I005
+# noqa I004
+from .cache import atag_versions, reference_cache_key, reference_response
+from .pagination import KeysetPagination
+from .viewer import get_viewer_state
+from foodgram.metrics import cache_lookup # noqa I001
+
+
+def make_viewset(viewset_class, actions, request, kwargs, **initkwargs):
+    """ Экземпляр ViewSet, как его создает as_view(), и запрос DRF. """
+    view = viewset_class(**initkwargs)
+    if 'get' in actions and 'head' not in actions:
+        actions = {**actions, 'head': actions['get']}
+    view.action_map = actions
+    for method, action in actions.items():
+        setattr(view, method, getattr(view, action))
+    view.request = request
+    view.args, view.kwargs = (), kwargs
+    view.action = actions.get(request.method.lower())
+    view.format_kwarg = None
+    view.headers = view.default_response_headers
+    view.request = view.initialize_request(request)
+    return view
+
+
+def accepts_json(view):
+    """ Клиент получит ответ в формате JSON. """
+    try:
+        renderer, media_type = view.perform_content_negotiation(view.request)
+    except APIException:
+        return False
+    view.request.accepted_renderer = renderer
+    view.request.accepted_media_type = media_type
+    return isinstance(renderer, JSONRenderer)
+
+
+def render(view, data):
+    """ Ответ с данными в формате JSON. """
+    if hasattr(view.request, 'profile'):
+        view.request.profile.render_start = time.perf_counter()
+    return HttpResponse(
+        view.request.accepted_renderer.render(
+            data, view.request.accepted_media_type,
+            view.get_renderer_context()),
+        content_type='application/json',
+    )
+
+
+def async_read_view(viewset_class, actions, handler, **initkwargs):
+    """ Асинхронное представление: GET обрабатывает handler, остальные
+    методы и запросы, для которых handler вернул None, - ViewSet.
+    """
+    sync_view = sync_to_async(viewset_class.as_view(actions, **initkwargs))
+
+    async def view(request, **kwargs):
+        if request.method == 'GET':
+            drf_view = make_viewset(
+                viewset_class, actions, request, kwargs, **initkwargs)
+            if accepts_json(drf_view):
+                response = await handler(drf_view)
+                if response is not None:
+                    # Заголовки Allow и Vary, как в finalize_response().
+                    for name, value in drf_view.headers.items():
+                        response[name] = value
+                    return response
+        return await sync_view(request, **kwargs)
+
+    view.cls = viewset_class
+    view.actions = actions
+    view.initkwargs = initkwargs
+    view.csrf_exempt = True
+    return view
+
+
+def is_anonymous(view):
+    """ Запрос без заголовка Authorization: аутентификация не нужна. """
+    return 'HTTP_AUTHORIZATION' not in view.request.META
+
+
+async def get_cached(view):
+    """ Ключ анонимного ответа и ответ из кеша (AnonymousCacheMixin).
+    Промах учитывается при сохранении ответа: запрос, переданный ViewSet,
+    учитывает сам AnonymousCacheMixin.
+    """
+    key = view.get_anonymous_cache_key(
+        view.request, await atag_versions(view.get_cache_tags()))
+    content = await cache.aget(key)
+    if content is not None:
+        cache_lookup('anonymous', True)
+    return key, content
+
+
+async def respond(view, data, key):
+    """ Ответ с данными; анонимный ответ сохраняется в кеш в том же виде,
+    что и в AnonymousCacheMixin.
+    """
+    if key is None:
+        return render(view, data)
+    cache_lookup('anonymous', False)
+    content = JSONRenderer().render(data)
+    await cache.aset(key, content, settings.ANONYMOUS_CACHE_TIMEOUT)
+    return HttpResponse(content, content_type='application/json')
+
+
+def prepare(view):
+    """ Аутентификация, права и фильтры DRF. Queryset или None,
+    если запрос должен обработать ViewSet.
+    """
+    try:
+        view.initial(view.request)
+        queryset = view.filter_queryset(view.get_queryset())
+        get_viewer_state(view.request)
+    except (APIException, Http404):
+        return None
+    return queryset
+
+
+def page_links(url, param, page, size, count):
+    """ Ссылки на соседние страницы, как в PageNumberPagination. """
+    next_link = previous_link = None
+    if page * size < count:
+        next_link = replace_query_param(url, param, page + 1)
+    if page == 2:
+        previous_link = remove_query_param(url, param)
+    elif page > 2:
+        previous_link = replace_query_param(url, param, page - 1)
+    return next_link, previous_link
+
+
+async def recipe_list(view):
+    """ Список рецептов с пагинацией по номеру страницы. """
+    params = view.request.query_params
+    if KeysetPagination.cursor_query_param in params:
+        return None
+    key = None
+    if is_anonymous(view):
+        key, content = await get_cached(view)
+        if content is not None:
+            return HttpResponse(content, content_type='application/json')
+    queryset = await sync_to_async(prepare)(view)
+    if queryset is None:
+        return None
+    paginator = view.paginator
+    size = paginator.get_page_size(view.request)
+    page = params.get(paginator.page_query_param, '1')
+    if not page.isdigit():
+        return None
+    page, count = int(page), await queryset.acount()
+    # Несуществующую страницу ViewSet вернет с ошибкой 404.
+    if page < 1 or (page - 1) * size >= max(count, 1):
+        return None
+    recipes = [
+        recipe async for recipe in queryset[(page - 1) * size:page * size]]
+    next_link, previous_link = page_links(
+        view.request.build_absolute_uri(), paginator.page_query_param,
+        page, size, count)
+    return await respond(view, OrderedDict((
+        ('count', count),
+        ('next', next_link),
+        ('previous', previous_link),
+        ('results', view.get_serializer(recipes, many=True).data),
+    )), key)
+
+
+async def recipe_detail(view):
+    """ Карточка рецепта. """
+    key = None
+    if is_anonymous(view):
+        key, content = await get_cached(view)
+        if content is not None:
+            return HttpResponse(content, content_type='application/json')
+    queryset = await sync_to_async(prepare)(view)
+    if queryset is None:
+        return None
+    try:
+        queryset = queryset.filter(pk=view.kwargs['pk'])
+    except ValueError:
+        return None
+    recipe = await queryset.afirst()
+    if recipe is None:
+        return None
+    return await respond(view, view.get_serializer(recipe).data, key)
+
+
+async def reference_list(view):
+    """ Список тегов или ингредиентов из кеша (ReferenceDataMixin).
+    При отсутствии в кеше список строит ViewSet.
+    """
+    if view.request.query_params:
+        return None
+    data = await cache.aget(reference_cache_key(view.queryset.model))
+    if data is None:
+        return None
+    cache_lookup('reference', True)
+    return reference_response(view.request, *data)
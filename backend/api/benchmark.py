@@ -0,0 +1,316 @@
+""" Бенчмарк REST API.
+
+Заполняет базу синтетическими данными через модели проекта и измеряет
+для каждого сценария число SQL-запросов (в том числе изменяющих данные),
+задержку (p50/p95) и объем выделенной памяти. Результат - словарь,
+который сохраняется в JSON и сравнивается между коммитами.
+"""
+import base64
+import random
+import statistics
+import time
+import tracemalloc
+from io import StringIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token  # noqa I001
+# noqa I004
+from recipes.models import (Cart, Favorite, Ingredient, IngredientInRecipe,
+                            Recipe, ShoppingListItem, Tag)
+from users.models import CustomUser, Follow
+
+IMAGE_NAME = 'recipes/benchmark.png'
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywaAAAA'
+    'CVBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQImWNoAAAA'
+    'ggCByxOyYQAAAABJRU5ErkJggg=='
+)
+WRITE_SQL = ('INSERT', 'UPDATE', 'DELETE')
+SYLLABLES = ('ка', 'ро', 'ма', 'ли', 'со', 'ту', 'не', 'пи', 'да', 'го')
+
+
+def fake_name(rnd, words=2):
+    """ Случайное название из слогов. """
+    return ' '.join(
+        ''.join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4)))
+        for _ in range(words)
+    )
+
+
+def seed(users=50, recipes=500, ingredients=1000, ingredients_per_recipe=8,
+         favorites=20, carts=5, follows=10, random_seed=42, batch_size=1000):
+    """ Заполняет базу синтетическими данными. """
+    rnd = random.Random(random_seed)
+    default_storage.save(IMAGE_NAME, ContentFile(
+        base64.b64decode(IMAGE.split(',', 1)[1])))
+    CustomUser.objects.bulk_create(
+        CustomUser(email=f'user{i}@example.com', username=f'user{i}',
+                   first_name='Имя', last_name='Фамилия')
+        for i in range(users)
+    )
+    Tag.objects.bulk_create(
+        Tag(name=name, color=f'#{i:06X}', slug=slug)
+        for i, (name, slug) in enumerate((
+            ('Завтрак', 'breakfast'), ('Обед', 'lunch'), ('Ужин', 'dinner'),
+        ))
+    )
+    Ingredient.objects.bulk_create(
+        (Ingredient(name=f'{fake_name(rnd)} {i}', measurement_unit='г')
+         for i in range(ingredients)),
+        batch_size=batch_size,
+    )
+    user_ids = list(CustomUser.objects.values_list('id', flat=True))
+    tag_ids = list(Tag.objects.values_list('id', flat=True))
+    ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+
+    Recipe.objects.bulk_create(
+        (Recipe(author_id=rnd.choice(user_ids), name=f'Рецепт {i}',
+                image=IMAGE_NAME, text=fake_name(rnd, 30),
+                cooking_time=rnd.randint(1, 120))
+         for i in range(recipes)),
+        batch_size=batch_size,
+    )
+    recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+    Recipe.tags.through.objects.bulk_create(
+        (Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+         for recipe_id in recipe_ids
+         for tag_id in rnd.sample(tag_ids, rnd.randint(1, len(tag_ids)))),
+        batch_size=batch_size,
+    )
+    IngredientInRecipe.objects.bulk_create(
+        (IngredientInRecipe(recipe_id=recipe_id, ingredient_id=ingredient_id,
+                            amount=rnd.randint(1, 500))
+         for recipe_id in recipe_ids
+         for ingredient_id in rnd.sample(ingredient_ids, min(
+             ingredients_per_recipe, len(ingredient_ids)))),
+        batch_size=batch_size,
+    )
+    for model, per_user in ((Favorite, favorites), (Cart, carts)):
+        model.objects.bulk_create(
+            (model(user_id=user_id, recipe_id=recipe_id)
+             for user_id in user_ids
+             for recipe_id in rnd.sample(
+                 recipe_ids, min(per_user, len(recipe_ids)))),
+            batch_size=batch_size,
+        )
+    Follow.objects.bulk_create(
+        (Follow(user_id=user_id, author_id=author_id)
+         for user_id in user_ids
+         for author_id in rnd.sample(user_ids, min(follows, len(user_ids)))
+         if author_id != user_id),
+        batch_size=batch_size,
+    )
+    ShoppingListItem.objects.rebuild()
+    call_command('reconcile_counters', stdout=StringIO())
+    call_command('rebuild_search_index', stdout=StringIO())
+
+
+class Scenario:
+    """ Сценарий бенчмарка: запрос к одному эндпоинту.
+
+    max_queries - предел числа SQL-запросов, не зависящий от объема
+    данных и размера страницы. auth - ключ токена в параметрах
+    запросов или False для анонимного запроса.
+    """
+
+    def __init__(self, name, method, path, auth='token', data=None,
+                 max_queries=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.auth = auth
+        self.data = data
+        self.max_queries = max_queries
+
+    def request(self, client, context, iteration):
+        path = self.path.format(**context)
+        kwargs = {}
+        if self.auth:
+            kwargs['HTTP_AUTHORIZATION'] = f"Token {context[self.auth]}"
+        if self.data is not None:
+            kwargs['data'] = self.data(context, iteration)
+            kwargs['content_type'] = 'application/json'
+        response = getattr(client, self.method)(path, **kwargs)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+
+def recipe_data(context, iteration):
+    """ Данные для создания рецепта. """
+    return {
+        'name': f"Бенчмарк {context['run']} {iteration}",
+        'text': 'Описание',
+        'cooking_time': 10,
+        'image': IMAGE,
+        'tags': context['tag_ids'][:1],
+        'ingredients': [
+            {'id': pk, 'amount': 10} for pk in context['ingredient_ids']
+        ],
+    }
+
+
+def recipe_edit_data(context, iteration):
+    """ Данные для изменения количества одного ингредиента рецепта. """
+    context['edits'] += 1
+    ingredients = [dict(element) for element in context['own_ingredients']]
+    ingredients[0]['amount'] = 1 + context['edits'] % 100
+    return {'tags': context['own_tags'], 'ingredients': ingredients}
+
+
+SCENARIOS = (
+    Scenario('recipe_list', 'get', '/api/recipes/?limit={limit}',
+             max_queries=5),
+    Scenario('recipe_list_anonymous', 'get', '/api/recipes/?limit={limit}',
+             auth=False),
+    Scenario('recipe_detail', 'get', '/api/recipes/{recipe_id}/',
+             max_queries=4),
+    Scenario('recipe_create', 'post', '/api/recipes/', data=recipe_data,
+             max_queries=18),
+    Scenario('recipe_update_single_ingredient', 'patch',
+             '/api/recipes/{own_recipe_id}/', data=recipe_edit_data,
+             max_queries=19),
+    Scenario('recipe_search', 'get',
+             '/api/recipes/?limit={limit}&search={recipe_query}'),
+    Scenario('recipe_by_ingredients', 'get',
+             '/api/recipes/by-ingredients/?limit={limit}'
+             '&ingredients={ingredient_query}'),
+    Scenario('recipe_feed', 'get', '/api/recipes/feed/?limit={limit}'),
+    Scenario('subscriptions', 'get',
+             '/api/users/subscriptions/?limit={limit}&recipes_limit=3',
+             max_queries=7),
+    Scenario('subscriptions_empty', 'get',
+             '/api/users/subscriptions/?limit={limit}&recipes_limit=3',
+             auth='new_user_token', max_queries=4),
+    Scenario('ingredient_search', 'get', '/api/ingredients/?name={query}'),
+    Scenario('tag_list', 'get', '/api/tags/', auth=False),
+    Scenario('shopping_list_download', 'get',
+             '/api/recipes/download_shopping_cart/'),
+)
+
+
+def percentile(values, share):
+    """ Перцентиль по ближайшему рангу. """
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+def build_context(limit=50, ingredients_per_recipe=8):
+    """ Параметры запросов для сценариев. """
+    user = CustomUser.objects.filter(
+        carts__isnull=False, recipes__isnull=False).first()
+    token, _ = Token.objects.get_or_create(user=user)
+    ingredient = Ingredient.objects.order_by('id').first()
+    own_recipe = user.recipes.order_by('id').first()
+    new_user, _ = CustomUser.objects.get_or_create(
+        username='benchmark-new-user', email='benchmark-new-user@example.com')
+    new_user_token, _ = Token.objects.get_or_create(user=new_user)
+    return {
+        'token': token.key,
+        'new_user_token': new_user_token.key,
+        'limit': limit,
+        'recipe_id': Recipe.objects.order_by('id').values_list(
+            'id', flat=True).first(),
+        'query': ingredient.name[:3],
+        'recipe_query': ingredient.name.split()[0],
+        'tag_ids': list(Tag.objects.values_list('id', flat=True)),
+        'ingredient_ids': list(Ingredient.objects.order_by('id').values_list(
+            'id', flat=True)[:ingredients_per_recipe]),
+        'run': time.monotonic_ns(),
+        'ingredient_query': ','.join(
+            str(pk) for pk in Ingredient.objects.order_by('id').values_list(
+                'id', flat=True)[:ingredients_per_recipe * 2]),
+        'own_recipe_id': own_recipe.id,
+        'own_tags': list(own_recipe.tags.values_list('id', flat=True)),
+        'own_ingredients': [
+            {'id': pk, 'amount': amount}
+            for pk, amount in own_recipe.ingredient.values_list(
+                'ingredient_id', 'amount')
+        ],
+        'edits': 0,
+    }
+
+
+def measure(scenario, client, context, repeat):
+    """ Измеряет один сценарий. """
+    scenario.request(client, context, 'warmup')
+    timings, queries, writes, statuses = [], [], [], set()
+    for iteration in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = scenario.request(client, context, iteration)
+            timings.append((time.perf_counter() - start) * 1000)
+        queries.append(len(captured))
+        writes.append(sum(
+            query['sql'].lstrip().split(None, 1)[0].upper() in WRITE_SQL
+            for query in captured
+        ))
+        statuses.add(response.status_code)
+
+    tracemalloc.start()
+    scenario.request(client, context, 'tracemalloc')
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'status': sorted(statuses),
+        'queries': max(queries),
+        'writes': max(writes),
+        'p50_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'peak_alloc_kb': round(peak / 1024, 1),
+    }
+
+
+def run(scenarios=SCENARIOS, repeat=20, **context_options):
+    """ Выполняет сценарии и возвращает отчет. """
+    # Ошибка сервера попадает в отчет (check_statuses), а не прерывает его.
+    client = Client(raise_request_exception=False)
+    context = build_context(**context_options)
+    return {
+        scenario.name: measure(scenario, client, context, repeat)
+        for scenario in scenarios
+    }
+
+
+def check_query_limits(report, scenarios=SCENARIOS):
+    """ Сценарии, превысившие max_queries. """
+    return [
+        f"{scenario.name}: запросов {report[scenario.name]['queries']}, "
+        f"предел {scenario.max_queries}"
+        for scenario in scenarios
+        if scenario.max_queries is not None and scenario.name in report
+        and report[scenario.name]['queries'] > scenario.max_queries
+    ]
+
+
+def check_statuses(report):
+    """ Сценарии, завершившиеся ошибкой сервера. """
+    return [
+        f"{name}: статус {status}"
+        for name, result in report.items()
+        for status in result['status'] if status >= 500
+    ]
+
+
+def compare(baseline, report, tolerance=0.2):
+    """ Регрессии отчета относительно базового: рост числа запросов
+    или p95 больше чем на tolerance.
+    """
+    regressions = []
+    for name, result in report.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if result['queries'] > previous['queries']:
+            regressions.append(
+                f"{name}: запросов {previous['queries']} -> "
+                f"{result['queries']}")
+        if result['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p95 {previous['p95_ms']} -> {result['p95_ms']} мс")
+    return regressions
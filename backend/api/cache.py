@@ -0,0 +1,148 @@
+""" Кеширование ответов API.
+
+Справочные таблицы (теги, ингредиенты) хранятся в кеше Django в виде
+готового JSON. Версия (ETag) - хеш содержимого, поэтому одинаковые данные
+в разных процессах дают один и тот же ETag. Кеш сбрасывается после
+фиксации изменений (api.signals); справочник, построенный запросом,
+который читал данные одновременно с изменением, хранится не дольше
+REFERENCE_CACHE_TIMEOUT.
+
+Ответы для анонимных пользователей (AnonymousCacheMixin) хранятся
+с версиями тегов кеша в ключе. invalidate_tags() увеличивает версии,
+и ответы, построенные по прежним данным, больше не используются.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from rest_framework.renderers import JSONRenderer  # noqa I001
+# noqa I004
+from foodgram.db_router import primary_reads  # noqa I001
+from foodgram.metrics import cache_lookup  # noqa I001
+
+
+def reference_cache_key(model):
+    """ Ключ кеша справочной таблицы. """
+    return f'reference:{model._meta.model_name}'
+
+
+def invalidate_reference(model):
+    """ Сбрасывает кеш справочной таблицы. """
+    cache.delete(reference_cache_key(model))
+
+
+def reference_response(request, content, etag):
+    """ Ответ со справочником или 304, если ETag не изменился. """
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(
+        response, public=True, max_age=settings.REFERENCE_CACHE_MAX_AGE)
+    return response
+
+
+class ReferenceDataMixin:
+    """ Отдает список справочника из кеша с поддержкой условных запросов.
+
+    Используется только для запроса списка без параметров в формате JSON,
+    остальные запросы обрабатываются стандартно.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if (request.query_params
+                or not isinstance(request.accepted_renderer, JSONRenderer)):
+            return super().list(request, *args, **kwargs)
+        return reference_response(request, *self.get_reference_data())
+
+    @primary_reads()
+    def get_reference_data(self):
+        """ Сериализованный справочник и его ETag. """
+        key = reference_cache_key(self.queryset.model)
+        data = cache.get(key)
+        cache_lookup('reference', data is not None)
+        if data is None:
+            content = JSONRenderer().render(
+                self.get_serializer(self.get_queryset(), many=True).data)
+            etag = quote_etag(hashlib.sha1(content).hexdigest())
+            data = (content, etag)
+            cache.set(key, data, settings.REFERENCE_CACHE_TIMEOUT)
+        return data
+
+
+def tag_cache_key(tag):
+    """ Ключ версии тега кеша. """
+    return f'tag:{tag}'
+
+
+def tag_versions(tags):
+    """ Текущие версии тегов. """
+    keys = [tag_cache_key(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    return [versions.get(key, 0) for key in keys]
+
+
+async def atag_versions(tags):
+    """ Текущие версии тегов, асинхронно. """
+    keys = [tag_cache_key(tag) for tag in tags]
+    versions = await cache.aget_many(keys)
+    return [versions.get(key, 0) for key in keys]
+
+
+def invalidate_tags(*tags):
+    """ Увеличивает версии тегов. """
+    for tag in tags:
+        try:
+            cache.incr(tag_cache_key(tag))
+        except ValueError:
+            cache.set(tag_cache_key(tag), 1, None)
+
+
+class AnonymousCacheMixin:
+    """ Кеширует ответы list и retrieve в формате JSON для анонимных
+    пользователей.
+
+    Ключ ответа включает адрес с параметрами запроса и версии тегов из
+    get_cache_tags(). Ответ хранится не дольше ANONYMOUS_CACHE_TIMEOUT:
+    изменения, не сбрасывающие теги (счетчики избранного, готовность
+    копий изображений), появляются в ответе с этой задержкой.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def get_cache_tags(self):
+        """ Теги, при сбросе которых устаревает ответ. """
+        raise NotImplementedError
+
+    def get_anonymous_cache_key(self, request, versions):
+        """ Ключ ответа для адреса запроса и версий тегов. """
+        url = hashlib.sha1(
+            request.build_absolute_uri().encode()).hexdigest()
+        versions = '.'.join(map(str, versions))
+        return f'anonymous:{self.basename}:{self.action}:{url}:{versions}'
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        if (request.user.is_authenticated
+                or not isinstance(request.accepted_renderer, JSONRenderer)):
+            return handler(request, *args, **kwargs)
+        key = self.get_anonymous_cache_key(
+            request, tag_versions(self.get_cache_tags()))
+        content = cache.get(key)
+        cache_lookup('anonymous', content is not None)
+        if content is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            content = JSONRenderer().render(response.data)
+            cache.set(key, content, settings.ANONYMOUS_CACHE_TIMEOUT)
+        return HttpResponse(content, content_type='application/json')
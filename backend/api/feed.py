@@ -0,0 +1,197 @@
+""" Лента рецептов авторов, на которых подписан пользователь.
+
+Для каждого пользователя в кеше Django хранится список id последних
+рецептов его подписок, отсортированный по убыванию. Новые рецепты
+добавляются в ленты подписчиков при публикации (fan-out on write), если
+у автора меньше FEED_FANOUT_MAX_FOLLOWERS подписчиков: изменение
+записывается в кеш под новой версией ленты подписчика (cache.incr)
+и применяется к кешированной ленте при чтении. Лента, отставшая больше
+чем на FEED_MAX_CHANGES версий или без записанных изменений (подписка
+и отписка), строится заново.
+Рецепты популярных авторов в ленты не записываются и выбираются одним
+запросом при чтении (fan-in on read).
+
+Лента упорядочена по id рецепта: id выдаются по возрастанию, поэтому
+порядок совпадает с порядком публикации. Страница выбирается параметром
+before - id последнего рецепта предыдущей страницы.
+
+Кешированная лента:
+    {'ids': [id рецептов], 'complete': в ленте все рецепты подписок,
+     'popular': [id популярных авторов на момент построения],
+     'version': версия ленты, изменения до которой применены}
+"""
+from django.conf import settings
+from django.core.cache import cache
+# noqa I004
+from foodgram.db_router import primary_reads  # noqa I001
+from foodgram.metrics import cache_lookup  # noqa I001
+from recipes.models import Recipe  # noqa I001
+from users.models import Follow, CustomUser as User  # noqa I001
+# noqa I005
+
+
+def feed_cache_key(user_id):
+    """ Ключ кеша ленты пользователя. """
+    return f'feed:{user_id}'
+
+
+def version_cache_key(user_id):
+    """ Ключ версии ленты пользователя. """
+    return f'feed:{user_id}:version'
+
+
+def change_cache_key(user_id, version):
+    """ Ключ изменения ленты, получившего номер версии version. """
+    return f'feed:{user_id}:change:{version}'
+
+
+def bump_version(user_id):
+    """ Увеличивает версию ленты пользователя и возвращает ее. """
+    key = version_cache_key(user_id)
+    cache.add(key, 0, None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Версия вытеснена из кеша: лента будет перестроена.
+        cache.set(key, 0, None)
+        return 0
+
+
+def invalidate_feed(user_id):
+    """ Сбрасывает ленту пользователя: новая версия без записи изменения
+    приводит к перестроению ленты при чтении.
+    """
+    bump_version(user_id)
+
+
+def popular_authors(user_id):
+    """ Авторы из подписок пользователя, рецепты которых читаются
+    при запросе ленты.
+    """
+    return set(Follow.objects.filter(
+        user_id=user_id,
+        author__followers_count__gte=settings.FEED_FANOUT_MAX_FOLLOWERS,
+    ).values_list('author_id', flat=True))
+
+
+def pushed_recipes(user_id, popular):
+    """ Рецепты подписок пользователя, кроме рецептов популярных авторов. """
+    return Recipe.objects.filter(
+        author__following__user_id=user_id,
+    ).exclude(author_id__in=popular).order_by('-id')
+
+
+@primary_reads()
+def build_feed(user_id):
+    """ Строит ленту пользователя и сохраняет ее в кеш. """
+    # Версия читается до запросов к БД: изменения, зафиксированные
+    # во время построения, получат большую версию и будут применены.
+    version = cache.get(version_cache_key(user_id), 0)
+    popular = popular_authors(user_id)
+    ids = list(pushed_recipes(user_id, popular).values_list(
+        'id', flat=True)[:settings.FEED_MAX_LENGTH + 1])
+    feed = {
+        'ids': ids[:settings.FEED_MAX_LENGTH],
+        'complete': len(ids) <= settings.FEED_MAX_LENGTH,
+        'popular': sorted(popular),
+        'version': version,
+    }
+    cache.set(feed_cache_key(user_id), feed, settings.FEED_CACHE_TIMEOUT)
+    return feed
+
+
+def fan_out(author_id, recipe_id, deleted=False):
+    """ Записывает добавление рецепта в ленты подписчиков автора или его
+    удаление из них.
+
+    Изменение сохраняется под новой версией ленты каждого подписчика
+    и применяется к ленте при чтении, поэтому одновременные публикации
+    не перезаписывают изменения друг друга. Рецепты популярных авторов
+    не записываются, удаленные рецепты из их лент пропускаются при чтении.
+    """
+    if not User.objects.filter(
+        pk=author_id,
+        followers_count__lt=settings.FEED_FANOUT_MAX_FOLLOWERS,
+    ).exists():
+        return
+    cache.set_many({
+        change_cache_key(user_id, bump_version(user_id)): (
+            recipe_id, deleted)
+        for user_id in Follow.objects.filter(
+            author_id=author_id).values_list('user_id', flat=True)
+    }, settings.FEED_CACHE_TIMEOUT)
+
+
+def apply_changes(feed, changes, version):
+    """ Лента с примененными изменениями (recipe_id, deleted). """
+    ids = set(feed['ids'])
+    for recipe_id, deleted in changes:
+        if deleted:
+            ids.discard(recipe_id)
+        else:
+            ids.add(recipe_id)
+    ids = sorted(ids, reverse=True)
+    return {
+        **feed,
+        'ids': ids[:settings.FEED_MAX_LENGTH],
+        'complete': (feed['complete']
+                     and len(ids) <= settings.FEED_MAX_LENGTH),
+        'version': version,
+    }
+
+
+def load_feed(user_id):
+    """ Лента из кеша с изменениями, записанными после ее сохранения.
+    Если лента устарела больше чем на FEED_MAX_CHANGES версий или
+    изменения не найдены в кеше, лента перестраивается.
+    """
+    feed_key, version_key = feed_cache_key(user_id), version_cache_key(
+        user_id)
+    cached = cache.get_many((feed_key, version_key))
+    feed, version = cached.get(feed_key), cached.get(version_key, 0)
+    cache_lookup('feed', feed is not None)
+    if feed is None:
+        return build_feed(user_id)
+    saved = feed.get('version')
+    if saved == version:
+        return feed
+    if saved is None or not 0 < version - saved <= settings.FEED_MAX_CHANGES:
+        return build_feed(user_id)
+    keys = [change_cache_key(user_id, number)
+            for number in range(saved + 1, version + 1)]
+    changes = cache.get_many(keys)
+    if len(changes) != len(keys):
+        return build_feed(user_id)
+    feed = apply_changes(feed, (changes[key] for key in keys), version)
+    cache.set(feed_key, feed, settings.FEED_CACHE_TIMEOUT)
+    return feed
+
+
+def get_feed_page(user_id, limit, before=None):
+    """ id рецептов страницы ленты.
+
+    Число запросов к БД не зависит от числа подписок: популярные авторы,
+    их рецепты и, если кешированная лента закончилась, продолжение
+    ленты из БД.
+    """
+    feed = load_feed(user_id)
+    if not feed['ids'] and not feed['complete']:
+        # Все рецепты неполной ленты удалены: продолжение ленты
+        # выбирается после последнего рецепта, поэтому лента строится
+        # заново.
+        feed = build_feed(user_id)
+    popular = popular_authors(user_id) | set(feed['popular'])
+
+    ids = [pk for pk in feed['ids'] if before is None or pk < before][:limit]
+    if not feed['complete'] and len(ids) < limit:
+        boundary = min(feed['ids'])
+        if before is not None:
+            boundary = min(boundary, before)
+        ids += pushed_recipes(user_id, popular).filter(
+            id__lt=boundary).values_list('id', flat=True)[:limit - len(ids)]
+    if popular:
+        recipes = Recipe.objects.filter(author_id__in=popular)
+        if before is not None:
+            recipes = recipes.filter(id__lt=before)
+        ids += recipes.order_by('-id').values_list('id', flat=True)[:limit]
+    return sorted(set(ids), reverse=True)[:limit]
@@ -1,7 +1,10 @@
-from django.db.models import IntegerField, Value
+from django.db.models import Case, IntegerField, When
 from django_filters.rest_framework import (BooleanFilter, CharFilter,
                                            FilterSet, filters)
+from rest_framework.filters import BaseFilterBackend  # noqa I001
 # noqa I004
+from recipes import search
+from recipes.indexes import ingredient_index
 from recipes.models import Ingredient, Recipe, Tag
 
 
@@ -32,11 +35,20 @@ class RecipeFilter(FilterSet):
         return queryset
 
 
-# Из за ограничений SQlite не поддерживается order_by в связке
-# с union в субзапросах
-# https://stackoverflow.com/questions/65577792/error-order-by-not-allowed-in-subqueries-of-compound-statements-in-django-whi
-# Получилось победить убрав сортировку в модели Ingredient
-# На PostgreSQL фильтр работает с сортировкой в Модели.
+class RecipeSearchFilter(BaseFilterBackend):
+    """ Полнотекстовый поиск рецептов по параметру search.
+        Рецепты сортируются по убыванию релевантности, если не задан
+        параметр ordering.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return search.search(queryset, query)
+
+
 class IngredientFilter(FilterSet):
     """ Фильтр для Ingredient.
         Поиск по полю name регистронезависимо:
@@ -51,19 +63,11 @@ class IngredientFilter(FilterSet):
         fields = ('name',)
 
     def search_name(self, queryset, name, value):
-        """ Поиск по имени Ingredient. """
+        """ Поиск по имени Ingredient через индекс в памяти. """
         if not value:
             return queryset
-        starts_with_queryset = (
-            queryset.filter(name__istartswith=value).annotate(
-                order=Value(0, IntegerField())
-            )
-        )
-        contain_queryset = (
-            queryset.filter(name__icontains=value).exclude(
-                pk__in=(ingredient.pk for ingredient in starts_with_queryset)
-            ).annotate(
-                order=Value(1, IntegerField())
-            )
-        )
-        return starts_with_queryset.union(contain_queryset).order_by('order')
+        ids = [ingredient.pk for ingredient in ingredient_index.search(value)]
+        return queryset.filter(pk__in=ids).order_by(Case(
+            *(When(pk=pk, then=position) for position, pk in enumerate(ids)),
+            output_field=IntegerField(),
+        ))
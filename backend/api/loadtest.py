@@ -0,0 +1,151 @@
+""" Нагрузочный тест запущенного сервера по HTTP.
+
+Запросы к нескольким адресам по кругу из нескольких потоков в течение
+заданного времени; память процессов сервера измеряется по /proc.
+Используется командами loadtest и gunicorn_sweep.
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+from itertools import cycle
+
+import requests
+
+DEFAULT_PATHS = (
+    '/api/recipes/',
+    '/api/recipes/?page=2',
+    '/api/tags/',
+    '/api/ingredients/',
+)
+
+
+def process_memory(pid):
+    """ Память процесса, байт: PSS - общие с другими процессами страницы
+    делятся между ними (preload_app), без smaps_rollup - RSS.
+    """
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as file:
+            for line in file:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        with open(f'/proc/{pid}/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return 0
+
+
+def process_tree_memory(pid):
+    """ Суммарная память процесса и его потомков, байт. """
+    children = defaultdict(list)
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as file:
+                stat = file.read()
+        except OSError:
+            continue
+        # Имя процесса в скобках может содержать пробелы.
+        ppid = int(stat[stat.rindex(')') + 2:].split()[1])
+        children[ppid].append(int(entry))
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        stack.extend(children[current])
+        total += process_memory(current)
+    return total
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    return round(values[min(int(len(values) * fraction),
+                            len(values) - 1)] * 1000, 1)
+
+
+class LoadTest:
+    """ Запросы по кругу из нескольких потоков до истечения времени. """
+
+    def __init__(self, url, paths, headers, server_pid=None):
+        self.url, self.paths, self.headers = url, list(paths), headers
+        self.server_pid = server_pid
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.peak_memory = 0
+        self.lock = threading.Lock()
+
+    def client(self, offset):
+        session = requests.Session()
+        session.headers.update(self.headers)
+        offset %= len(self.paths)
+        for path in cycle(self.paths[offset:] + self.paths[:offset]):
+            if time.monotonic() >= self.deadline:
+                return
+            start = time.perf_counter()
+            try:
+                ok = session.get(self.url + path).status_code < 400
+            except requests.RequestException:
+                ok = False
+            latency = time.perf_counter() - start
+            with self.lock:
+                self.latencies[path].append(latency)
+                self.errors[path] += not ok
+
+    def sample_memory(self):
+        while time.monotonic() < self.deadline:
+            self.peak_memory = max(
+                self.peak_memory, process_tree_memory(self.server_pid))
+            time.sleep(0.5)
+
+    def run(self, concurrency, duration):
+        """ Отчет: запросов в секунду, перцентили задержки и ошибки
+        по адресам, пиковая память процессов сервера.
+        """
+        self.deadline = time.monotonic() + duration
+        threads = [threading.Thread(target=self.client, args=(number,))
+                   for number in range(concurrency)]
+        if self.server_pid:
+            threads.append(threading.Thread(target=self.sample_memory))
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        report = {'concurrency': concurrency, 'duration': round(elapsed, 1),
+                  'paths': {}}
+        for path in self.paths:
+            values = sorted(self.latencies[path])
+            report['paths'][path] = {
+                'requests': len(values),
+                'errors': self.errors[path],
+                'rps': round(len(values) / elapsed, 1),
+                'latency_ms': {
+                    'p50': percentile(values, 0.5),
+                    'p95': percentile(values, 0.95),
+                    'p99': percentile(values, 0.99),
+                },
+            }
+        total = sum(len(values) for values in self.latencies.values())
+        report['rps'] = round(total / elapsed, 1)
+        report['errors'] = sum(self.errors.values())
+        if self.server_pid:
+            report['peak_memory_mb'] = round(self.peak_memory / 2 ** 20, 1)
+        return report
+
+
+def wait_until_ready(url, timeout=60):
+    """ Ждет, пока сервер начнет отвечать. """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return True
+        except requests.RequestException:
+            time.sleep(0.5)
+    return False
@@ -0,0 +1,91 @@
+import json
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+# noqa I004
+from api import benchmark  # noqa I001
+
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    }
+}
+
+
+class Command(BaseCommand):
+    help = (' Бенчмарк эндпоинтов API на синтетических данных. '
+            'Данные создаются во временной тестовой базе, ответы '
+            'кешируются в памяти процесса. Завершается с ошибкой, если '
+            'сценарий превысил предел SQL-запросов или ответил ошибкой '
+            'сервера. ')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--ingredients', type=int, default=1000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Избранных рецептов на пользователя')
+        parser.add_argument('--carts', type=int, default=5,
+                            help='Рецептов в корзине на пользователя')
+        parser.add_argument('--follows', type=int, default=10,
+                            help='Подписок на пользователя')
+        parser.add_argument('--limit', type=int, default=50,
+                            help='Размер страницы для списков')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Файл для отчета в JSON')
+        parser.add_argument('--compare',
+                            help='Отчет в JSON для поиска регрессий')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True)
+        try:
+            # Кеш процесса вместо общего (Redis): синтетические справочники,
+            # ленты и версии индексов не должны попасть в кеш сервера.
+            # Бенчмарк выполняется в одном процессе, поэтому множества
+            # ViewerState кешируются, как с общим кешем.
+            with override_settings(MEDIA_ROOT=tempfile.mkdtemp(),
+                                   CACHES=BENCHMARK_CACHES,
+                                   VIEWER_STATE_CACHE=True):
+                benchmark.seed(
+                    users=options['users'],
+                    recipes=options['recipes'],
+                    ingredients=options['ingredients'],
+                    ingredients_per_recipe=options['ingredients_per_recipe'],
+                    favorites=options['favorites'],
+                    carts=options['carts'],
+                    follows=options['follows'],
+                    random_seed=options['seed'],
+                )
+                report = benchmark.run(
+                    repeat=options['repeat'],
+                    limit=options['limit'],
+                    ingredients_per_recipe=options['ingredients_per_recipe'],
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        self.stdout.write(output)
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                regressions = benchmark.compare(json.load(file), report)
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(regression))
+            if not regressions:
+                self.stdout.write(self.style.SUCCESS('- регрессий нет'))
+        violations = (benchmark.check_query_limits(report)
+                      + benchmark.check_statuses(report))
+        if violations:
+            raise CommandError('\n'.join(violations))
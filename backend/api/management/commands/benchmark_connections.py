@@ -0,0 +1,106 @@
+import json
+import threading
+import time
+
+from django.core import signals
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+# noqa I004
+from api.loadtest import percentile  # noqa I001
+
+
+class Command(BaseCommand):
+    help = (' Время запроса к БД с новым и с постоянным соединением '
+            '(CONN_MAX_AGE) при нескольких одновременных потоках. '
+            'Каждый запрос обрабатывается как запрос Django: сигналы '
+            'request_started и request_finished закрывают соединение '
+            'или оставляют его открытым по настройкам. Используется '
+            'база из настроек, в том числе через pgbouncer (DB_HOST). ')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, action='append',
+                            help='Число потоков, можно указать несколько '
+                                 'раз (по умолчанию 1, 8, 32)')
+        parser.add_argument('--max-age', type=int, action='append',
+                            dest='max_ages',
+                            help='CONN_MAX_AGE, можно указать несколько '
+                                 'раз (по умолчанию 0 и 60)')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Запросов на поток')
+        parser.add_argument('--queries', type=int, default=5,
+                            help='SQL-запросов на запрос')
+        parser.add_argument('--output', help='Файл для отчета в JSON')
+
+    @staticmethod
+    def handle_request(queries):
+        """ Запрос Django с queries SQL-запросами, время в секундах. """
+        start = time.perf_counter()
+        signals.request_started.send(sender=Command)
+        with connection.cursor() as cursor:
+            for _ in range(queries):
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+        signals.request_finished.send(sender=Command)
+        return time.perf_counter() - start
+
+    def measure(self, max_age, concurrency, options):
+        """ Задержка запросов и число открытых соединений. """
+        connections.settings['default']['CONN_MAX_AGE'] = max_age
+        latencies, opened = [], []
+        lock = threading.Lock()
+
+        def count_connection(sender, **kwargs):
+            with lock:
+                opened.append(1)
+
+        def worker():
+            values = [self.handle_request(options['queries'])
+                      for _ in range(options['requests'])]
+            connection.close()
+            with lock:
+                latencies.extend(values)
+
+        connection_created.connect(count_connection)
+        threads = [threading.Thread(target=worker)
+                   for _ in range(concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        connection_created.disconnect(count_connection)
+        latencies.sort()
+        return {
+            'conn_max_age': max_age,
+            'concurrency': concurrency,
+            'connections': len(opened),
+            'rps': round(len(latencies) / elapsed, 1),
+            'latency_ms': {
+                'mean': round(sum(latencies) / len(latencies) * 1000, 2),
+                'p50': percentile(latencies, 0.5),
+                'p95': percentile(latencies, 0.95),
+            },
+        }
+
+    def handle(self, *args, **options):
+        connection.close()
+        max_age = connections.settings['default'].get('CONN_MAX_AGE', 0)
+        report = []
+        try:
+            for concurrency in options['concurrency'] or (1, 8, 32):
+                for value in options['max_ages'] or (0, 60):
+                    result = self.measure(value, concurrency, options)
+                    report.append(result)
+                    self.stdout.write(
+                        f'потоков {concurrency}, CONN_MAX_AGE={value}: '
+                        f'{result["latency_ms"]["mean"]} мс в среднем, '
+                        f'p95 {result["latency_ms"]["p95"]} мс, '
+                        f'{result["rps"]} запросов/с, '
+                        f'соединений {result["connections"]}')
+        finally:
+            connections.settings['default']['CONN_MAX_AGE'] = max_age
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, indent=2)
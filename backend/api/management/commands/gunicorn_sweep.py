@@ -0,0 +1,93 @@
+import json
+import os
+import subprocess
+from itertools import product
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+# noqa I004
+from api.loadtest import DEFAULT_PATHS, LoadTest, wait_until_ready  # noqa I001
+
+
+class Command(BaseCommand):
+    help = (' Перебор настроек gunicorn (gunicorn.conf.py): для каждого '
+            'сочетания режима, профиля и числа процессов запускается '
+            'сервер на локальной базе и выполняется нагрузочный тест. '
+            'Результаты выводятся по убыванию числа запросов в секунду. ')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', action='append', dest='profiles',
+                            help='Профиль GUNICORN_PROFILE, можно указать '
+                                 'несколько раз (по умолчанию sync, '
+                                 'gthread, small)')
+        parser.add_argument('--mode', action='append', dest='modes',
+                            choices=('wsgi', 'asgi'),
+                            help='SERVER_MODE (по умолчанию wsgi)')
+        parser.add_argument('--workers', action='append', type=int,
+                            help='WEB_CONCURRENCY вместо значения профиля')
+        parser.add_argument('--threads', action='append', type=int,
+                            help='GUNICORN_THREADS вместо значения профиля')
+        parser.add_argument('--preload', action='append',
+                            choices=('true', 'false'),
+                            help='GUNICORN_PRELOAD вместо значения профиля')
+        parser.add_argument('--port', type=int, default=8011)
+        parser.add_argument('--path', action='append', dest='paths')
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=20)
+        parser.add_argument('--token', help='Токен пользователя')
+        parser.add_argument('--output', help='Файл для отчета в JSON')
+
+    def run_server(self, url, options, env):
+        """ Запускает gunicorn с окружением env и нагружает его. """
+        server = subprocess.Popen(
+            ('gunicorn', '-c', 'gunicorn.conf.py',
+             '--bind', f'127.0.0.1:{options["port"]}'),
+            cwd=settings.BASE_DIR, env={**os.environ, **env},
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            if not wait_until_ready(url):
+                raise CommandError(f'Сервер не запустился: {env}')
+            headers = {}
+            if options['token']:
+                headers['Authorization'] = f'Token {options["token"]}'
+            return LoadTest(
+                url, options['paths'] or DEFAULT_PATHS, headers, server.pid,
+            ).run(options['concurrency'], options['duration'])
+        finally:
+            server.terminate()
+            server.wait()
+
+    def handle(self, *args, **options):
+        url = f'http://127.0.0.1:{options["port"]}'
+        results = []
+        overrides = {
+            'WEB_CONCURRENCY': options['workers'],
+            'GUNICORN_THREADS': options['threads'],
+            'GUNICORN_PRELOAD': options['preload'],
+        }
+        for mode, profile, *values in product(
+                options['modes'] or ('wsgi',),
+                options['profiles'] or ('sync', 'gthread', 'small'),
+                *(values or (None,) for values in overrides.values())):
+            env = {'SERVER_MODE': mode, 'GUNICORN_PROFILE': profile}
+            for name, value in zip(overrides, values):
+                if value is not None:
+                    env[name] = str(value)
+            self.stderr.write(f'- {env}')
+            report = self.run_server(url, options, env)
+            results.append({'config': env, **report})
+
+        results.sort(key=lambda result: -result['rps'])
+        for result in results:
+            p95 = max(
+                (path['latency_ms']['p95'] or 0)
+                for path in result['paths'].values())
+            self.stdout.write(
+                f'{json.dumps(result["config"], sort_keys=True)}: '
+                f'{result["rps"]} запросов/с, p95 до {p95} мс, '
+                f'ошибок {result["errors"]}, '
+                f'память {result["peak_memory_mb"]} МБ')
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=2)
@@ -0,0 +1,43 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError  # noqa I001
+# noqa I004
+from api.loadtest import DEFAULT_PATHS, LoadTest  # noqa I001
+
+
+class Command(BaseCommand):
+    help = (' Нагрузочный тест запущенного сервера: запросы по кругу '
+            'из нескольких потоков в течение заданного времени. '
+            'Для сравнения режимов WSGI и ASGI сервер запускается '
+            'с одинаковым объемом памяти, пиковый объем процессов сервера '
+            'измеряется по --server-pid (главный процесс gunicorn). ')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8001')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Адрес запроса, можно указать несколько раз')
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=30,
+                            help='Длительность теста, с')
+        parser.add_argument('--token', help='Токен пользователя')
+        parser.add_argument('--server-pid', type=int)
+        parser.add_argument('--output', help='Файл для отчета в JSON')
+
+    def handle(self, *args, **options):
+        server_pid = options['server_pid']
+        if server_pid and not os.path.exists(f'/proc/{server_pid}'):
+            raise CommandError(f'Процесс {server_pid} не найден')
+        headers = {}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+        report = LoadTest(
+            options['url'], options['paths'] or DEFAULT_PATHS,
+            headers, server_pid,
+        ).run(options['concurrency'], options['duration'])
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        self.stdout.write(output)
@@ -1,7 +1,147 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from collections import OrderedDict
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """ Пагинация по ключу сортировки (keyset).
+
+    Страница выбирается условием на значения полей сортировки последнего
+    элемента предыдущей страницы, без OFFSET и без COUNT(*). Сортировка
+    берется из queryset и дополняется полем pk для однозначности.
+    """
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Некорректный курсор.'
+
+    def __init__(self, page_size):
+        self.page_size = page_size
+
+    @staticmethod
+    def get_ordering(queryset):
+        """ Поля сортировки [(поле, по убыванию)] или None, если
+        сортировка задана выражением.
+        """
+        ordering = []
+        for field in (queryset.query.order_by
+                      or queryset.model._meta.ordering):
+            if not isinstance(field, str):
+                return None
+            ordering.append((field.lstrip('-'), field.startswith('-')))
+        if not any(field in ('pk', 'id') for field, _ in ordering):
+            ordering.append(('pk', False))
+        return ordering
+
+    @staticmethod
+    def get_value(obj, field):
+        for attr in field.split('__'):
+            obj = getattr(obj, attr)
+        return obj
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return data['v'], bool(data.get('r'))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj, reverse):
+        values = []
+        for field, _ in self.ordering:
+            value = self.get_value(obj, field)
+            if not isinstance(value, (int, float, str)):
+                value = str(value)
+            values.append(value)
+        cursor = base64.urlsafe_b64encode(
+            json.dumps({'v': values, 'r': reverse}).encode()).decode()
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, cursor)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ordering = self.get_ordering(queryset)
+        self.base_url = request.build_absolute_uri()
+        values, reverse = self.decode_cursor(request)
+        if values is not None and len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        self.count = None
+        if request.query_params.get(self.count_query_param) == 'true':
+            self.count = queryset.count()
+
+        order_by = [
+            f"{'-' if descending != reverse else ''}{field}"
+            for field, descending in self.ordering
+        ]
+        if values is not None:
+            queryset = queryset.filter(reduce(or_, (
+                Q(**{field: value for (field, _), value
+                     in zip(self.ordering[:position], values)},
+                  **{f"{field}__{'lt' if descending != reverse else 'gt'}":
+                     values[position]})
+                for position, (field, descending) in enumerate(self.ordering)
+            )))
+        results = list(queryset.order_by(*order_by)[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+        self.has_next = has_more or (reverse and values is not None)
+        self.has_previous = (has_more and reverse) or (
+            values is not None and not reverse)
+        self.results = results
+        return results
+
+    def get_next_link(self):
+        if not self.has_next or not self.results:
+            return None
+        return self.encode_cursor(self.results[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.results:
+            return None
+        return self.encode_cursor(self.results[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
 
 
 class LimitPagination(PageNumberPagination):
-    """ Кастомная пагинация. """
+    """ Кастомная пагинация.
+
+    Размер страницы задается параметром limit, не больше max_page_size.
+    С параметром cursor (для первой страницы - пустым) используется
+    пагинация по ключу KeysetPagination, ответ имеет тот же формат,
+    count вычисляется только с параметром count=true.
+    """
     page_size = 6
     page_size_query_param = 'limit'
+    max_page_size = settings.MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if (KeysetPagination.cursor_query_param in request.query_params
+                and KeysetPagination.get_ordering(queryset) is not None):
+            self.keyset = KeysetPagination(self.get_page_size(request))
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,303 @@
+""" Профилирование запросов к API.
+
+ProfilingMiddleware измеряет для каждого запроса общее время ответа,
+число SQL-запросов и время их выполнения, время рендеринга ответа DRF
+(сериализация в JSON) и находит повторяющиеся SQL-запросы - признак N+1.
+Статистика собирается по обработчикам: для ViewSet - класс и действие
+(RecipeViewSet.list), для остальных - имя маршрута.
+
+SQL-запросы учитывает обертка выполнения (record_query), которую
+получает каждое новое соединение с БД (сигнал connection_created).
+Соединения принадлежат потоку, а под ASGI запросы к БД выполняются
+в потоках sync_to_async, поэтому обертка находит измерения текущего
+запроса через переменную контекста current_profile: sync_to_async
+передает контекст в поток. Так SQL-запросы учитываются и в режиме
+WSGI, и в режиме ASGI.
+
+Те же измерения передаются в метрики Prometheus (foodgram.metrics).
+Статистика хранится в памяти процесса: каждый процесс gunicorn
+отдает свою. Просмотр и сброс - GET и DELETE /api/profiling/
+(только для персонала). С PROFILING_SERVER_TIMING измерения запроса
+добавляются в заголовок Server-Timing.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+# noqa I004
+from foodgram import metrics
+
+logger = logging.getLogger(__name__)
+
+UNRESOLVED = 'unresolved'
+
+current_profile = ContextVar('current_profile', default=None)
+
+
+class QueryRecorder:
+    """ Обертка выполнения SQL: число запросов, время и повторы.
+
+    Текст запроса передается с плейсхолдерами, поэтому запросы,
+    отличающиеся только параметрами, считаются одинаковыми.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    def duplicates(self):
+        """ Запросы, выполненные не меньше PROFILING_DUPLICATE_THRESHOLD
+        раз, и число их выполнений.
+        """
+        return {
+            sql: count for sql, count in self.statements.items()
+            if count >= settings.PROFILING_DUPLICATE_THRESHOLD
+        }
+
+
+class RequestProfile:
+    """ Измерения одного запроса. """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.endpoint = UNRESOLVED
+        self.queries = QueryRecorder()
+        self.render_start = None
+        self.total = self.render = 0.0
+
+    def finish(self):
+        end = time.perf_counter()
+        self.total = end - self.start
+        if self.render_start is not None:
+            self.render = end - self.render_start
+
+    def server_timing(self):
+        """ Значение заголовка Server-Timing. """
+        app = self.total - self.queries.duration - self.render
+        return ', '.join((
+            f'db;dur={self.queries.duration * 1000:.1f};'
+            f'desc="SQL x{self.queries.count}"',
+            f'app;dur={app * 1000:.1f}',
+            f'render;dur={self.render * 1000:.1f}',
+            f'total;dur={self.total * 1000:.1f}',
+        ))
+
+
+class EndpointStats:
+    """ Накопленная статистика обработчика. Время - в секундах. """
+
+    def __init__(self):
+        self.requests = self.errors = 0
+        self.histogram = [0] * (len(settings.PROFILING_LATENCY_BUCKETS) + 1)
+        self.total = self.max_total = 0.0
+        self.queries = self.max_queries = 0
+        self.db_time = self.render_time = 0.0
+        self.duplicates = {}
+
+    def add(self, profile, status_code):
+        self.requests += 1
+        self.errors += status_code >= 500
+        self.histogram[bisect_left(
+            settings.PROFILING_LATENCY_BUCKETS, profile.total * 1000)] += 1
+        self.total += profile.total
+        self.max_total = max(self.max_total, profile.total)
+        self.queries += profile.queries.count
+        self.max_queries = max(self.max_queries, profile.queries.count)
+        self.db_time += profile.queries.duration
+        self.render_time += profile.render
+        for sql, count in profile.queries.duplicates().items():
+            if sql not in self.duplicates:
+                if len(self.duplicates) >= settings.PROFILING_MAX_DUPLICATES:
+                    continue
+                logger.warning('Повторяющийся SQL-запрос (%s раз) в %s: %s',
+                               count, profile.endpoint, sql)
+                self.duplicates[sql] = {'requests': 0, 'max_repeats': 0}
+            duplicate = self.duplicates[sql]
+            duplicate['requests'] += 1
+            duplicate['max_repeats'] = max(duplicate['max_repeats'], count)
+
+    def percentile(self, fraction):
+        """ Верхняя граница интервала гистограммы, в который попадает
+        перцентиль, в мс. None - больше последней границы.
+        """
+        buckets = settings.PROFILING_LATENCY_BUCKETS
+        target, seen = fraction * self.requests, 0
+        for bound, count in zip(buckets, self.histogram):
+            seen += count
+            if seen >= target:
+                return bound
+        return None
+
+    def as_dict(self):
+        buckets = settings.PROFILING_LATENCY_BUCKETS
+        labels = [f'<={bound}' for bound in buckets] + [f'>{buckets[-1]}']
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'latency_ms': {
+                'mean': round(self.total / self.requests * 1000, 1),
+                'max': round(self.max_total * 1000, 1),
+                'p50': self.percentile(0.5),
+                'p95': self.percentile(0.95),
+                'total': round(self.total * 1000, 1),
+                'histogram': dict(zip(labels, self.histogram)),
+            },
+            'queries': {
+                'mean': round(self.queries / self.requests, 1),
+                'max': self.max_queries,
+            },
+            'db_ms': round(self.db_time / self.requests * 1000, 1),
+            'render_ms': round(self.render_time / self.requests * 1000, 1),
+            'duplicates': [
+                {'sql': sql, **duplicate}
+                for sql, duplicate in sorted(
+                    self.duplicates.items(),
+                    key=lambda item: -item[1]['max_repeats'])
+            ],
+        }
+
+
+class ProfilingStats:
+    """ Статистика обработчиков процесса. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, profile, status_code):
+        with self._lock:
+            if profile.endpoint not in self._endpoints:
+                self._endpoints[profile.endpoint] = EndpointStats()
+            self._endpoints[profile.endpoint].add(profile, status_code)
+
+    def snapshot(self):
+        """ Статистика по убыванию суммарного времени ответа. """
+        with self._lock:
+            endpoints = sorted(self._endpoints.items(),
+                               key=lambda item: -item[1].total)
+            return {
+                'pid': os.getpid(),
+                'endpoints': [
+                    {'endpoint': endpoint, **endpoint_stats.as_dict()}
+                    for endpoint, endpoint_stats in endpoints
+                ],
+            }
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+stats = ProfilingStats()
+
+
+def record_query(execute, sql, params, many, context):
+    """ Обертка выполнения SQL: учитывает запрос в измерениях текущего
+    запроса к API, если он профилируется.
+    """
+    profile = current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile.queries(execute, sql, params, many, context)
+
+
+def install_query_recorder(connection):
+    """ Подключает record_query к соединению один раз: при повторном
+    подключении объект соединения остается прежним.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def endpoint_name(request, view_func):
+    """ Класс и действие ViewSet или имя маршрута. """
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return request.resolver_match.view_name or view_func.__name__
+    method = request.method.lower()
+    action = (getattr(view_func, 'actions', None) or {}).get(method, method)
+    return f'{view_class.__name__}.{action}'
+
+
+class ProfilingMiddleware:
+    """ Собирает статистику запросов (PROFILING_ENABLED) и метрики
+    Prometheus (METRICS_ENABLED).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Как в MiddlewareMixin: под ASGI обработчик не занимает поток.
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        else:
+            self._is_coroutine = None
+
+    @staticmethod
+    def enabled():
+        return settings.PROFILING_ENABLED or settings.METRICS_ENABLED
+
+    def __call__(self, request):
+        if self._is_coroutine:
+            return self.__acall__(request)
+        if not self.enabled():
+            return self.get_response(request)
+        token = current_profile.set(RequestProfile())
+        request.profile = current_profile.get()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        if not self.enabled():
+            return await self.get_response(request)
+        token = current_profile.set(RequestProfile())
+        request.profile = current_profile.get()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.finish(request, response)
+
+    @staticmethod
+    def finish(request, response):
+        """ Сохраняет измерения запроса. """
+        profile = request.profile
+        profile.finish()
+        if settings.PROFILING_ENABLED:
+            stats.record(profile, response.status_code)
+        if settings.METRICS_ENABLED:
+            metrics.observe_request(
+                profile, request.method, response.status_code)
+        if settings.PROFILING_SERVER_TIMING:
+            response['Server-Timing'] = profile.server_timing()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, 'profile'):
+            request.profile.endpoint = endpoint_name(request, view_func)
+
+    def process_template_response(self, request, response):
+        if hasattr(request, 'profile'):
+            request.profile.render_start = time.perf_counter()
+        return response
@@ -0,0 +1,161 @@
+""" Форматы выгрузки списка покупок.
+
+Каждый формат - рендерер DRF, выбирается по параметру ?format= или
+заголовку Accept. Файл формируется методом stream() по частям из
+итератора строк ингредиентов, поэтому список целиком в памяти
+не хранится.
+"""
+import csv
+import json
+from io import BytesIO
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
+from rest_framework.renderers import BaseRenderer
+
+TITLE = 'Список покупок:'
+FOOTER = 'Foodgram - продуктовый помощник '
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """ Базовый рендерер списка покупок.
+
+    render() используется DRF только для ответов с ошибками.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+    @property
+    def content_type(self):
+        if self.charset:
+            return f'{self.media_type}; charset={self.charset}'
+        return self.media_type
+
+    @staticmethod
+    def line(ingredient):
+        """ Строка списка покупок для ингредиента. """
+        return (f"{ingredient['ingredient__name']} - "
+                f"{ingredient['amount']} "
+                f"{ingredient['ingredient__measurement_unit']}")
+
+    def stream(self, ingredients):
+        """ Итератор частей файла. """
+        raise NotImplementedError
+
+
+class TxtShoppingListRenderer(ShoppingListRenderer):
+    """ Список покупок в текстовом файле. """
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, ingredients):
+        yield TITLE
+        for ingredient in ingredients:
+            yield f'\n{self.line(ingredient)}'
+        yield f'\n{FOOTER}'
+
+
+class EchoBuffer:
+    """ Буфер для csv.writer, возвращающий записанную строку. """
+
+    def write(self, value):
+        return value
+
+
+class CsvShoppingListRenderer(ShoppingListRenderer):
+    """ Список покупок в формате CSV. """
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, ingredients):
+        writer = csv.writer(EchoBuffer())
+        yield '\ufeff' + writer.writerow(
+            ('Ингредиент', 'Количество', 'Единица измерения'))
+        for ingredient in ingredients:
+            yield writer.writerow((
+                ingredient['ingredient__name'],
+                ingredient['amount'],
+                ingredient['ingredient__measurement_unit'],
+            ))
+
+
+class JsonShoppingListRenderer(ShoppingListRenderer):
+    """ Список покупок в формате JSON. """
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, ingredients):
+        separator = '['
+        for ingredient in ingredients:
+            yield separator + json.dumps({
+                'name': ingredient['ingredient__name'],
+                'measurement_unit': ingredient['ingredient__measurement_unit'],
+                'amount': ingredient['amount'],
+            }, ensure_ascii=False)
+            separator = ','
+        yield '[]' if separator == '[' else ']'
+
+
+class PdfShoppingListRenderer(ShoppingListRenderer):
+    """ Список покупок в формате PDF.
+
+    Формат PDF требует таблицу смещений в конце файла, поэтому документ
+    собирается в памяти и отдается частями после формирования.
+    """
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    render_style = 'binary'
+    font_name = 'ShoppingListFont'
+    font_size = 12
+    margin = 50
+
+    def get_font(self):
+        """ Шрифт с кириллицей, если он доступен в системе. """
+        if self.font_name in pdfmetrics.getRegisteredFontNames():
+            return self.font_name
+        try:
+            pdfmetrics.registerFont(
+                TTFont(self.font_name, settings.SHOPPING_LIST_PDF_FONT))
+        except OSError:
+            return 'Helvetica'
+        return self.font_name
+
+    def stream(self, ingredients):
+        buffer = BytesIO()
+        canvas = Canvas(buffer, pagesize=A4)
+        font = self.get_font()
+        _, height = A4
+        position = height - self.margin
+        canvas.setFont(font, self.font_size)
+        for line in self.lines(ingredients):
+            if position < self.margin:
+                canvas.showPage()
+                canvas.setFont(font, self.font_size)
+                position = height - self.margin
+            canvas.drawString(self.margin, position, line)
+            position -= self.font_size * 1.5
+        canvas.save()
+        buffer.seek(0)
+        yield from iter(lambda: buffer.read(settings.FILE_CHUNK_SIZE), b'')
+
+    def lines(self, ingredients):
+        yield TITLE
+        for ingredient in ingredients:
+            yield self.line(ingredient)
+        yield FOOTER
+
+
+SHOPPING_LIST_RENDERERS = (
+    TxtShoppingListRenderer,
+    CsvShoppingListRenderer,
+    JsonShoppingListRenderer,
+    PdfShoppingListRenderer,
+)
@@ -1,24 +1,74 @@
 from django.conf import settings
-from django.shortcuts import get_object_or_404
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import status  # noqa I005
 from rest_framework.exceptions import ValidationError  # noqa I005
-from rest_framework.serializers import (IntegerField, ModelSerializer,  # noqa I005
+from rest_framework.serializers import (IntegerField, ListField,  # noqa I005
+                                        ModelSerializer,  # noqa I005
                                         PrimaryKeyRelatedField, ReadOnlyField,  # noqa I005
                                         SerializerMethodField,  # noqa I005
                                         UniqueTogetherValidator)  # noqa I005
 # noqa I004
+from .viewer import get_viewer_state
+from foodgram.metrics import IMAGE_UPLOAD_BYTES  # noqa I001
+from recipes import images  # noqa I001
 from recipes.models import (Cart, Favorite, Ingredient, IngredientInRecipe,  # noqa I001
-                            Recipe, Tag)  # noqa I001
+                            Recipe, ShoppingListItem, Tag)  # noqa I001
+from recipes.signals import shopping_lists_accounted  # noqa I001
 from users.models import CustomUser as User  # noqa I001
 # noqa I005
 
 
-class RecipeMinifiedSerializer(ModelSerializer):
+class RecipeImageMixin:
+    """ Ссылки на уменьшенные копии изображения рецепта.
+
+    Пока копии не созданы, image_thumb ссылается на оригинал,
+    а srcset равен None.
+    """
+
+    def get_image_url(self, name):
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def get_image_thumb(self, recipe):
+        """ Копия изображения шириной IMAGE_THUMB_WIDTH или меньше. """
+        if not recipe.image:
+            return None
+        if not images.is_current(recipe):
+            return self.get_image_url(recipe.image.name)
+        sizes = recipe.image_versions['sizes']
+        width = max(
+            (int(width) for width in sizes
+             if int(width) <= settings.IMAGE_THUMB_WIDTH),
+            default=min(int(width) for width in sizes),
+        )
+        return self.get_image_url(sizes[str(width)])
+
+    def get_srcset(self, recipe):
+        """ Значение атрибута srcset со всеми копиями изображения. """
+        if not images.is_current(recipe):
+            return None
+        sizes = recipe.image_versions['sizes']
+        return ', '.join(
+            f'{self.get_image_url(sizes[width])} {width}w'
+            for width in sorted(sizes, key=int)
+        )
+
+
+class RecipeMinifiedSerializer(RecipeImageMixin, ModelSerializer):
     """ Сериализатор для модели Recipe с минимальным набором полей. """
+    image_thumb = SerializerMethodField()
+    srcset = SerializerMethodField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time',)
+        fields = ('id', 'name', 'image', 'image_thumb', 'srcset',
+                  'cooking_time',)
         read_only_fields = ('id', 'name', 'image', 'cooking_time',)
 
 
@@ -33,12 +83,8 @@ class UserSerializer(ModelSerializer):
 
     def get_is_subscribed(self, obj):
         """ Проверка подписки пользователя. """
-        request = self.context.get('request')
-        return (
-            request is not None
-            and request.user.is_authenticated
-            and obj.follower.filter(user=request.user).exists()
-        )
+        return obj.pk in get_viewer_state(
+            self.context.get('request')).following
 
 
 class UserSubscribeSerializer(UserSerializer):
@@ -55,6 +101,8 @@ class UserSubscribeSerializer(UserSerializer):
         """ Проверка дублирования подписки на автора и на свой профиль. """
         author = self.instance
         user = self.context.get('request').user
+        # Множества ViewerState могут отставать от БД, а повторная
+        # подписка нарушила бы ограничение уникальности.
         if user.follower.filter(author=author).exists():
             raise ValidationError(
                 detail='Ошибка подписки. Подписка уже существует',
@@ -68,18 +116,37 @@ class UserSubscribeSerializer(UserSerializer):
         return data
 
     def get_recipes_count(self, user):
-        """ Считает количество рецептов у автора. """
-        return user.recipes.count()
+        """ Количество рецептов у автора. """
+        return user.recipes_count
+
+    @staticmethod
+    def get_recipes_limit(request):
+        """ Параметр recipes_limit: целое неотрицательное число,
+        не больше SUBSCRIPTION_RECIPES_LIMIT (значение по умолчанию).
+        """
+        limit = request.query_params.get('recipes_limit')
+        if limit is None:
+            return settings.SUBSCRIPTION_RECIPES_LIMIT
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = -1
+        if limit < 0:
+            raise ValidationError(
+                {'recipes_limit': 'Требуется целое неотрицательное число'})
+        return min(limit, settings.SUBSCRIPTION_RECIPES_LIMIT)
 
     def get_recipes(self, author):
+        """ Рецепты автора. Для страницы подписок загружены
+        представлением в context['recipes'] одним запросом.
+        """
         request = self.context.get('request')
         if request is None:
             return False
-        limit = request.query_params.get('recipes_limit')
-        print(limit)
-        recipes = author.recipes.all()
-        if limit:
-            recipes = recipes[:int(limit)]
+        if 'recipes' in self.context:
+            recipes = self.context['recipes'].get(author.pk, ())
+        else:
+            recipes = author.recipes.all()[:self.get_recipes_limit(request)]
         return RecipeMinifiedSerializer(
             recipes, read_only=True, many=True).data
 
@@ -112,8 +179,10 @@ class IngredientInRecipeReadSerializer(ModelSerializer):
 
 
 class IngredientInRecipeCreateSerializer(ModelSerializer):
-    """ Сериализатор добавления ингридиентов для рецепта. """
-    id = PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    """ Сериализатор добавления ингридиентов для рецепта.
+    Наличие ингредиентов проверяется в RecipeCreateSerializer.validate.
+    """
+    id = IntegerField()
     amount = IntegerField(write_only=True)
 
     class Meta:
@@ -131,50 +200,52 @@ class RecipeBaseSerializer(ModelSerializer):
         model = Recipe
 
 
-class RecipeReadSerializer(RecipeBaseSerializer):
+class RecipeReadSerializer(RecipeImageMixin, RecipeBaseSerializer):
     """ Сериализатор для чтения рецептов. """
     tags = TagSerializer(many=True)
     ingredients = SerializerMethodField()
     is_favorited = SerializerMethodField()
     is_in_shopping_cart = SerializerMethodField()
+    image_thumb = SerializerMethodField()
+    srcset = SerializerMethodField()
 
     class Meta(RecipeBaseSerializer.Meta):
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time',
+            'is_in_shopping_cart', 'name', 'image', 'image_thumb', 'srcset',
+            'text', 'cooking_time',
         )
 
     def get_ingredients(self, recipe):
         """ Получает список ингридиентов для рецепта. """
-        ingredients = IngredientInRecipe.objects.filter(recipe=recipe)
-        return IngredientInRecipeReadSerializer(ingredients, many=True).data
+        return IngredientInRecipeReadSerializer(
+            recipe.ingredient.all(), many=True).data
 
     def get_is_favorited(self, recipe):
         """ Рецепт в избранном. """
-        request = self.context.get('request')
-        return (
-            request is not None
-            and request.user.is_authenticated
-            and recipe.favorites.filter(user=request.user).exists()
-        )
+        return recipe.pk in get_viewer_state(
+            self.context.get('request')).favorites
 
     def get_is_in_shopping_cart(self, recipe):
         """ Рецепт в списке покупок. """
-        request = self.context.get('request')
-        return (
-            request is not None
-            and request.user.is_authenticated
-            and recipe.carts.filter(user=request.user).exists()
+        return recipe.pk in get_viewer_state(
+            self.context.get('request')).carts
+
+
+class RecipeCoverageSerializer(RecipeReadSerializer):
+    """ Сериализатор рецептов, подобранных по имеющимся ингредиентам. """
+    ingredients_matched = IntegerField(read_only=True)
+    ingredients_total = IntegerField(read_only=True)
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = RecipeReadSerializer.Meta.fields + (
+            'ingredients_matched', 'ingredients_total',
         )
 
 
 class RecipeCreateSerializer(RecipeBaseSerializer):
     """ Сериализатор для создания, редактирования и удаления рецептов. """
-    tags = PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all(),
-        error_messages={'does_not_exist': 'Указанного тега не существует'}
-    )
+    tags = ListField(child=IntegerField())
     ingredients = IngredientInRecipeCreateSerializer(many=True)
 
     class Meta(RecipeBaseSerializer.Meta):
@@ -183,43 +254,62 @@ class RecipeCreateSerializer(RecipeBaseSerializer):
             'cooking_time',
         )
 
-    def validate(self, data):
-        """ Проверка входных данных при создании и редактировании рецепта. """
-        tags = self.initial_data.get('tags')
-        ingredients = self.initial_data.get('ingredients')
-
-        # валидация Tags
+    def validate_tags(self, tags):
+        """ Проверка тегов одним запросом к БД. """
         if not tags:
-            raise ValidationError(
-                {'tags': 'Требуется добавить тег'})
-        tags_list = [None]
-        for tag in tags:
-            if not Tag.objects.filter(id=tag).exists():
-                raise ValidationError({'tags': 'Такого тега не существует'})
-            if tag in tags_list:
-                raise ValidationError({'tags': 'Тег уже добавлен в рецепт'})
-            tags_list.append(tag)
-
-        # валидация Ingredients и Amount
+            raise ValidationError('Требуется добавить тег')
+        found = Tag.objects.in_bulk(tags)
+        errors = []
+        missing = sorted(set(tags) - found.keys())
+        if missing:
+            errors.append(f'Указанного тега не существует: {missing}')
+        if len(set(tags)) != len(tags):
+            errors.append('Тег уже добавлен в рецепт')
+        if errors:
+            raise ValidationError(errors)
+        return [found[pk] for pk in tags]
+
+    def validate_ingredients(self, ingredients):
+        """ Проверка ингредиентов и количества одним запросом к БД. """
         if not ingredients:
-            raise ValidationError(
-                {'ingredients': 'Требуется добавить ингридиент'})
-        ingredients_list = [None]
+            raise ValidationError('Требуется добавить ингридиент')
+        ids = [element['id'] for element in ingredients]
+        found = Ingredient.objects.in_bulk(ids)
+        errors = []
+        missing = sorted(set(ids) - found.keys())
+        if missing:
+            errors.append(f'Указанного ингредиента не существует: {missing}')
+        if len(set(ids)) != len(ids):
+            errors.append('Ингредиент уже добавлен в рецепт')
+        if any(element['amount'] < settings.MIN_INGR_AMOUNT
+               for element in ingredients):
+            errors.append('Количество ингредиента должно быть больше 1')
+        if errors:
+            raise ValidationError(errors)
         for element in ingredients:
-            ingredient = get_object_or_404(Ingredient, id=element['id'])
-            if ingredient in ingredients_list:
-                raise ValidationError(
-                    {'ingredients': 'Ингредиент уже добавлен в рецепт'})
-            if int(element.get('amount')) < settings.MIN_INGR_AMOUNT:
-                raise ValidationError(
-                    'Количество ингредиента должно быть больше 1')
-            ingredients_list.append(ingredient)
-
-        # валидация Сooking_time
-        if int(data.get('cooking_time')) < settings.MIN_COOKING_TIME:
+            element['id'] = found[element['id']]
+        return ingredients
+
+    def validate_image(self, image):
+        IMAGE_UPLOAD_BYTES.observe(image.size)
+        return image
+
+    def validate_cooking_time(self, cooking_time):
+        if cooking_time < settings.MIN_COOKING_TIME:
             raise ValidationError(
-                {'cooking_time':
-                 'Время приготовления должно быть больше 1 минуты'})
+                'Время приготовления должно быть больше 1 минуты')
+        return cooking_time
+
+    def validate(self, data):
+        """ Теги и ингредиенты обязательны и при частичном обновлении. """
+        errors = {
+            field: message for field, message in (
+                ('tags', 'Требуется добавить тег'),
+                ('ingredients', 'Требуется добавить ингридиент'),
+            ) if field not in data
+        }
+        if errors:
+            raise ValidationError(errors)
         return data
 
     @staticmethod
@@ -233,6 +323,37 @@ class RecipeCreateSerializer(RecipeBaseSerializer):
             ) for ingredient in ingredients
         ]).sort(key=(lambda item: item.ingredient.name), reverse=True)
 
+    @staticmethod
+    def update_ingredients(recipe, ingredients):
+        """ Изменяет связи Ingredient и Recipe: добавляет новые, обновляет
+        количество измененных и удаляет отсутствующие.
+        """
+        current = {
+            item.ingredient_id: item
+            for item in IngredientInRecipe.objects.filter(recipe=recipe)
+        }
+        old_amounts = {pk: item.amount for pk, item in current.items()}
+        amounts = {
+            element['id'].pk: element['amount'] for element in ingredients}
+        changed = []
+        for pk, item in current.items():
+            if pk in amounts and item.amount != amounts[pk]:
+                item.amount = amounts[pk]
+                changed.append(item)
+        removed = [
+            item.pk for pk, item in current.items() if pk not in amounts]
+        if removed:
+            # Списки покупок изменяет change_recipe ниже одним запросом.
+            with shopping_lists_accounted(recipe.pk):
+                IngredientInRecipe.objects.filter(pk__in=removed).delete()
+        IngredientInRecipe.objects.bulk_update(changed, ('amount',))
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient_id=pk, amount=amount)
+            for pk, amount in amounts.items() if pk not in current
+        )
+        ShoppingListItem.objects.change_recipe(recipe, old_amounts, amounts)
+
+    @transaction.atomic
     def create(self, validated_data):
         """ Создает рецепт. """
         request = self.context.get('request', None)
@@ -244,26 +365,29 @@ class RecipeCreateSerializer(RecipeBaseSerializer):
             raise ValidationError(
                 {'recipe': 'Вы уже добавляли рецепт с таким именем'})
         recipe = Recipe.objects.create(author=request.user, **validated_data)
+        User.objects.filter(pk=request.user.pk).update(
+            recipes_count=F('recipes_count') + 1)
         recipe.tags.set(tags)
         self.create_ingredients(recipe, ingredients)
         return recipe
 
+    @transaction.atomic
     def update(self, recipe, validated_data):
         """ Редактирует рецепт. """
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         if tags:
-            recipe.tags.clear()
             recipe.tags.set(tags)
         if ingredients:
-            recipe.ingredients.clear()
-            self.create_ingredients(recipe, ingredients)
+            self.update_ingredients(recipe, ingredients)
         return super().update(recipe, validated_data)
 
     def to_representation(self, recipe):
-        return RecipeReadSerializer(recipe, context={
-            'request': self.context.get('request')
-        }).data
+        request = self.context.get('request')
+        return RecipeReadSerializer(
+            Recipe.objects.with_related().get(pk=recipe.pk),
+            context={'request': request},
+        ).data
 
 
 class FavoriteSerializer(ModelSerializer):
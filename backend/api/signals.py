@@ -0,0 +1,81 @@
+""" Обработчики сигналов приложения `api`. """
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_reference, invalidate_tags
+from .feed import fan_out, invalidate_feed
+from .profiling import install_query_recorder
+from .viewer import invalidate_viewer_state
+from recipes.models import Cart, Favorite, Ingredient, Recipe, Tag  # noqa I001
+from recipes.signals import data_loaded  # noqa I001
+from users.models import Follow  # noqa I001
+
+
+@receiver((post_save, post_delete, data_loaded), sender=Ingredient)
+@receiver((post_save, post_delete, data_loaded), sender=Tag)
+def invalidate_reference_cache(sender, **kwargs):
+    """ Сбрасывает кеш справочника и ответов с рецептами после фиксации
+    транзакции: до нее запрос в другом процессе построил бы кеш
+    по прежним данным.
+    """
+    def invalidate():
+        invalidate_reference(sender)
+        invalidate_tags('reference')
+
+    transaction.on_commit(invalidate)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe_responses(sender, instance, **kwargs):
+    """ Сбрасывает кешированные ответы с рецептом после фиксации
+    транзакции.
+    """
+    recipe_id = instance.id
+    transaction.on_commit(
+        lambda: invalidate_tags('recipes', f'recipe:{recipe_id}'))
+
+
+@receiver(post_save, sender=Recipe)
+def add_to_feeds(sender, instance, created, **kwargs):
+    """ Добавляет новый рецепт в ленты подписчиков автора. """
+    if created:
+        author_id, recipe_id = instance.author_id, instance.id
+        transaction.on_commit(lambda: fan_out(author_id, recipe_id))
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_from_feeds(sender, instance, **kwargs):
+    """ Удаляет рецепт из лент подписчиков автора. """
+    author_id, recipe_id = instance.author_id, instance.id
+    transaction.on_commit(
+        lambda: fan_out(author_id, recipe_id, deleted=True))
+
+
+@receiver((post_save, post_delete), sender=Follow)
+def invalidate_follower_feed(sender, instance, **kwargs):
+    """ Сбрасывает ленту пользователя после фиксации подписки или
+    отписки: до нее лента была бы построена по прежним подпискам.
+    """
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_feed(user_id))
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=Cart)
+@receiver((post_save, post_delete), sender=Follow)
+def invalidate_viewer(sender, instance, **kwargs):
+    """ Сбрасывает кешированные избранное, список покупок и подписки
+    пользователя после фиксации транзакции.
+    """
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_viewer_state(user_id))
+
+
+@receiver(connection_created)
+def record_profiled_queries(sender, connection, **kwargs):
+    """ Учет SQL-запросов профилируемых запросов к API (ProfilingMiddleware)
+    в новом соединении.
+    """
+    install_query_recorder(connection)
@@ -0,0 +1,178 @@
+""" Тесты API: число SQL-запросов не зависит от объема данных,
+проверки перед записью не используют кешированные данные.
+"""
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token  # noqa I005
+from rest_framework.test import APIClient  # noqa I005
+# noqa I004
+from api.benchmark import IMAGE  # noqa I001
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe,  # noqa I001
+                            Recipe, Tag)  # noqa I001
+from users.models import CustomUser as User  # noqa I001
+from users.models import Follow  # noqa I001
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_PIPELINE_WORKERS=0)
+class QueryCountTestCase(TestCase):
+    """ Общие данные: авторы, теги, ингредиенты и рецепты. """
+
+    recipes_count = 30
+    ingredients_per_recipe = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = User.objects.bulk_create(
+            User(email=f'author{i}@example.com', username=f'author{i}',
+                 first_name='Имя', last_name='Фамилия')
+            for i in range(5)
+        )
+        cls.user = User.objects.create(
+            email='user@example.com', username='user',
+            first_name='Имя', last_name='Фамилия')
+        cls.token = Token.objects.create(user=cls.user)
+        cls.tags = Tag.objects.bulk_create(
+            Tag(name=f'Тег {i}', color=f'#00000{i}', slug=f'tag{i}')
+            for i in range(3)
+        )
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(30)
+        )
+        cls.recipes = Recipe.objects.bulk_create(
+            Recipe(author=cls.authors[i % len(cls.authors)],
+                   name=f'Рецепт {i}', image='recipes/test.png',
+                   text='Описание', cooking_time=10)
+            for i in range(cls.recipes_count)
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in cls.recipes for tag in cls.tags[:2]
+        )
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(
+                recipe=recipe, amount=10,
+                ingredient=cls.ingredients[(i + j) % len(cls.ingredients)])
+            for i, recipe in enumerate(cls.recipes)
+            for j in range(cls.ingredients_per_recipe)
+        )
+        Favorite.objects.bulk_create(
+            Favorite(user=cls.user, recipe=recipe)
+            for recipe in cls.recipes[::2]
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def assert_queries(self, number, method, path, **kwargs):
+        """ Запрос выполняет number SQL-запросов (кеш пуст). """
+        cache.clear()
+        with self.assertNumQueries(number):
+            response = getattr(self.client, method)(path, **kwargs)
+        self.assertLess(response.status_code, 400, response.content)
+        return response
+
+
+class RecipeReadQueriesTest(QueryCountTestCase):
+    """ Список и карточка рецепта (RecipeQuerySet.with_related). """
+
+    def test_list_queries_do_not_depend_on_page_size(self):
+        for limit in (1, self.recipes_count):
+            with self.subTest(limit=limit):
+                response = self.assert_queries(
+                    8, 'get', f'/api/recipes/?limit={limit}')
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_detail_queries(self):
+        self.assert_queries(7, 'get', f'/api/recipes/{self.recipes[0].id}/')
+
+
+class RecipeWriteQueriesTest(QueryCountTestCase):
+    """ Создание и изменение рецепта: проверка тегов и ингредиентов
+    и запись связей выполняются одним запросом на модель.
+    """
+
+    def recipe_data(self, size, amount=10):
+        return {
+            'name': f'Новый рецепт {size}',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': IMAGE,
+            'tags': [tag.id for tag in self.tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient in self.ingredients[:size]
+            ],
+        }
+
+    def test_create_queries_do_not_depend_on_ingredients(self):
+        for size in (2, 25):
+            with self.subTest(ingredients=size):
+                self.assert_queries(
+                    17, 'post', '/api/recipes/',
+                    data=self.recipe_data(size), format='json')
+
+    def test_update_queries_do_not_depend_on_ingredients(self):
+        for size in (2, 25):
+            with self.subTest(ingredients=size):
+                recipe = self.client.post(
+                    '/api/recipes/', data=self.recipe_data(size),
+                    format='json').data
+                data = self.recipe_data(size)
+                data['ingredients'][0]['amount'] = 20
+                self.assert_queries(
+                    17, 'patch', f'/api/recipes/{recipe["id"]}/',
+                    data=data, format='json')
+
+
+class SubscriptionQueriesTest(QueryCountTestCase):
+    """ Страница подписок: рецепты всех авторов - одним запросом. """
+
+    def follow(self, authors):
+        Follow.objects.filter(user=self.user).delete()
+        Follow.objects.bulk_create(
+            Follow(user=self.user, author=author) for author in authors)
+
+    def test_queries_do_not_depend_on_authors(self):
+        for size in (1, len(self.authors)):
+            with self.subTest(authors=size):
+                self.follow(self.authors[:size])
+                response = self.assert_queries(
+                    7, 'get', '/api/users/subscriptions/?recipes_limit=3')
+                self.assertEqual(len(response.data['results']), size)
+
+    def test_recipes_in_model_order(self):
+        self.follow(self.authors)
+        response = self.client.get(
+            '/api/users/subscriptions/?recipes_limit=3')
+        for author in response.data['results']:
+            self.assertEqual(
+                [recipe['id'] for recipe in author['recipes']],
+                list(Recipe.objects.filter(author_id=author['id']).values_list(
+                    'id', flat=True)[:3]),
+            )
+
+
+@override_settings(VIEWER_STATE_CACHE=True)
+class StaleViewerStateTest(QueryCountTestCase):
+    """ Повторная подписка при устаревших множествах ViewerState. """
+
+    def test_repeated_subscribe_is_rejected(self):
+        author = self.authors[0]
+        self.client.get('/api/recipes/')
+        # Подписка в обход сигналов: множества в кеше не сбрасываются.
+        Follow.objects.bulk_create([Follow(user=self.user, author=author)])
+        response = self.client.post(f'/api/users/{author.id}/subscribe/')
+        self.assertEqual(response.status_code, 400)
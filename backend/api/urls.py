@@ -1,7 +1,11 @@
-from django.urls import include, path
+from django.conf import settings
+from django.urls import include, path, re_path
 from rest_framework.routers import DefaultRouter
 
-from .views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from .async_views import (async_read_view, recipe_detail, recipe_list,
+                          reference_list)
+from .views import (IngredientViewSet, ProfilingStatsView, RecipeViewSet,
+                    TagViewSet, UserViewSet)
 
 app_name = 'api'
 
@@ -12,6 +16,33 @@ router_v1.register('ingredients', IngredientViewSet, basename='ingredients')
 router_v1.register('users', UserViewSet, basename='users')
 
 urlpatterns = [
+    path('profiling/', ProfilingStatsView.as_view(), name='profiling'),
+]
+
+if settings.ASYNC_READ_VIEWS:
+    # Те же адреса и имена, что у маршрутов router_v1, проверяются первыми.
+    urlpatterns += [
+        path('recipes/', async_read_view(
+            RecipeViewSet, {'get': 'list', 'post': 'create'}, recipe_list,
+            basename='recipes', detail=False,
+        ), name='recipes-list'),
+        re_path(r'^recipes/(?P<pk>[^/.]+)/$', async_read_view(
+            RecipeViewSet,
+            {'get': 'retrieve', 'put': 'update',
+             'patch': 'partial_update', 'delete': 'destroy'},
+            recipe_detail, basename='recipes', detail=True,
+        ), name='recipes-detail'),
+        path('tags/', async_read_view(
+            TagViewSet, {'get': 'list'}, reference_list,
+            basename='tags', detail=False,
+        ), name='tags-list'),
+        path('ingredients/', async_read_view(
+            IngredientViewSet, {'get': 'list'}, reference_list,
+            basename='ingredients', detail=False,
+        ), name='ingredients-list'),
+    ]
+
+urlpatterns += [
     path('', include(router_v1.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
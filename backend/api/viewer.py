@@ -0,0 +1,91 @@
+""" Избранное, список покупок и подписки пользователя запроса.
+
+Флаги is_favorited, is_in_shopping_cart и is_subscribed проверяются
+по множествам id, загруженным один раз за запрос. С общим для процессов
+кешем (VIEWER_STATE_CACHE) множества хранятся в кеше Django вместе
+с версией, на момент которой они загружены. Версия увеличивается после
+фиксации изменений избранного, списка покупок и подписок (api.signals),
+устаревшие данные в кеше не используются. С кешем процесса множества
+загружаются из БД в каждом запросе.
+
+Проверки перед записью (повторная подписка) выполняются запросом к БД,
+а не по множествам.
+"""
+from django.conf import settings
+from django.core.cache import cache
+# noqa I004
+from foodgram.db_router import primary_reads  # noqa I001
+from foodgram.metrics import cache_lookup  # noqa I001
+from recipes.models import Cart, Favorite  # noqa I001
+from users.models import Follow  # noqa I001
+# noqa I005
+
+
+class ViewerState:
+    """ id рецептов в избранном и списке покупок пользователя и id
+    авторов, на которых он подписан.
+
+    Изменения, сделанные в том же запросе после загрузки, вносятся
+    в множества представлением.
+    """
+
+    def __init__(self, favorites=(), carts=(), following=()):
+        self.favorites = set(favorites)
+        self.carts = set(carts)
+        self.following = set(following)
+
+    @staticmethod
+    def query(user_id):
+        """ Запросы множеств пользователя к БД. """
+        return (
+            Favorite.objects.filter(
+                user_id=user_id).values_list('recipe_id', flat=True),
+            Cart.objects.filter(
+                user_id=user_id).values_list('recipe_id', flat=True),
+            Follow.objects.filter(
+                user_id=user_id).values_list('author_id', flat=True),
+        )
+
+    @classmethod
+    @primary_reads()
+    def load(cls, user_id):
+        """ Множества пользователя из кеша или из БД. """
+        if not settings.VIEWER_STATE_CACHE:
+            return cls(*cls.query(user_id))
+        version_key, data_key = viewer_cache_keys(user_id)
+        cached = cache.get_many((version_key, data_key))
+        version = cached.get(version_key, 0)
+        data = cached.get(data_key)
+        cache_lookup('viewer', data is not None and data[0] == version)
+        if data is not None and data[0] == version:
+            return cls(*data[1:])
+        state = cls(*cls.query(user_id))
+        cache.set(data_key, (version, state.favorites, state.carts,
+                             state.following),
+                  settings.VIEWER_STATE_TIMEOUT)
+        return state
+
+
+def viewer_cache_keys(user_id):
+    """ Ключи кеша версии и множеств пользователя. """
+    return f'viewer:{user_id}:version', f'viewer:{user_id}'
+
+
+def invalidate_viewer_state(user_id):
+    """ Увеличивает версию множеств пользователя. """
+    version_key, _ = viewer_cache_keys(user_id)
+    try:
+        cache.incr(version_key)
+    except ValueError:
+        cache.set(version_key, 1, None)
+
+
+def get_viewer_state(request):
+    """ Множества пользователя запроса, загружаются при первом вызове.
+    Для анонимного пользователя и без запроса - пустые.
+    """
+    if request is None or not request.user.is_authenticated:
+        return ViewerState()
+    if not hasattr(request, 'viewer_state'):
+        request.viewer_state = ViewerState.load(request.user.pk)
+    return request.viewer_state
@@ -1,23 +1,38 @@
-from django.db.models import Sum
-from django.http.response import HttpResponse
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.http.response import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import status # noqa I005
 from rest_framework.decorators import action # noqa I005
-from rest_framework.permissions import IsAuthenticated # noqa I005
+from rest_framework.exceptions import ValidationError # noqa I005
+from rest_framework.filters import OrderingFilter # noqa I005
+from rest_framework.permissions import IsAdminUser, IsAuthenticated # noqa I005
 from rest_framework.response import Response # noqa I005
+from rest_framework.utils.urls import replace_query_param # noqa I005
+from rest_framework.views import APIView # noqa I005
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet # noqa I005
 # noqa I004
-from .filters import IngredientFilter, RecipeFilter
+from .cache import AnonymousCacheMixin, ReferenceDataMixin
+from .feed import get_feed_page
+from .filters import IngredientFilter, RecipeFilter, RecipeSearchFilter
 from .pagination import LimitPagination
 from .permissions import AuthorOrReadOnly
+from .profiling import stats
+from .renderers import SHOPPING_LIST_RENDERERS
 from .serializers import (CartSerializer, FavoriteSerializer,
-                          IngredientSerializer, RecipeCreateSerializer,
-                          RecipeReadSerializer, TagSerializer,
-                          UserSubscribeSerializer)
-from recipes.models import (Cart, Favorite, Ingredient, IngredientInRecipe, # noqa I001
-                            Recipe, Tag) # noqa I001
+                          IngredientSerializer, RecipeCoverageSerializer,
+                          RecipeCreateSerializer, RecipeReadSerializer,
+                          TagSerializer, UserSubscribeSerializer)
+from .viewer import get_viewer_state
+from foodgram.metrics import timed_stream # noqa I001
+from recipes.indexes import ingredient_index, recipe_ingredient_index # noqa I001
+from recipes.models import (Cart, Favorite, Ingredient, Recipe, # noqa I001
+                            RecipeNeighbor, Tag) # noqa I001
 from users.models import Follow, CustomUser as User # noqa I001
 
 
@@ -30,6 +45,7 @@ class UserViewSet(DjoserUserViewSet):
         detail=True,
         permission_classes=(IsAuthenticated,),
     )
+    @transaction.atomic
     def subscribe(self, request, id):
         """ Подписаться или отписаться от пользователя. """
         user = request.user
@@ -40,9 +56,14 @@ class UserViewSet(DjoserUserViewSet):
                 author, data=request.data, context={'request': request})
             serializer.is_valid(raise_exception=True)
             Follow.objects.create(author=author, user=user)
+            get_viewer_state(request).following.add(author.pk)
+            User.objects.filter(pk=author.pk).update(
+                followers_count=F('followers_count') + 1)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         get_object_or_404(Follow, author=author, user=user).delete()
+        User.objects.filter(pk=author.pk, followers_count__gt=0).update(
+            followers_count=F('followers_count') - 1)
         return Response({'detail': 'Успешная отписка'},
                         status=status.HTTP_204_NO_CONTENT)
 
@@ -51,24 +72,35 @@ class UserViewSet(DjoserUserViewSet):
         permission_classes=(IsAuthenticated,),
     )
     def subscriptions(self, request):
-        """ Подписки пользователя. """
+        """ Подписки пользователя с рецептами авторов.
+        Число запросов не зависит от размера страницы.
+        """
+        limit = UserSubscribeSerializer.get_recipes_limit(request)
+        authors = self.paginate_queryset(
+            User.objects.filter(following__user=request.user))
+        recipes = defaultdict(list)
+        if limit:
+            for recipe in Recipe.objects.only(
+                'id', 'name', 'image', 'image_versions', 'cooking_time',
+                'author_id',
+            ).first_by_author([author.pk for author in authors], limit):
+                recipes[recipe.author_id].append(recipe)
         serializer = UserSubscribeSerializer(
-            self.paginate_queryset(
-                User.objects.filter(following__user=request.user)),
+            authors,
             many=True,
-            context={'request': request}
+            context={'request': request, 'recipes': recipes}
         )
         return self.get_paginated_response(serializer.data)
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class TagViewSet(ReferenceDataMixin, ReadOnlyModelViewSet):
     """ Список тегов. """
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(ReferenceDataMixin, ReadOnlyModelViewSet):
     """ Список ингредиентов. """
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
@@ -76,14 +108,47 @@ class IngredientViewSet(ReadOnlyModelViewSet):
     filterset_class = IngredientFilter
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        """ Поиск по имени обслуживается индексом без запросов к БД. """
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        serializer = self.get_serializer(
+            ingredient_index.search(name), many=True)
+        return Response(serializer.data)
+
 
-class RecipeViewSet(ModelViewSet):
+class RecipeViewSet(AnonymousCacheMixin, ModelViewSet):
     """ Список рецептов. """
     queryset = Recipe.objects.select_related('author')
     permission_classes = (AuthorOrReadOnly,)
     pagination_class = LimitPagination
-    filter_backends = (DjangoFilterBackend,)
+    filter_backends = (DjangoFilterBackend, RecipeSearchFilter, OrderingFilter)
     filterset_class = RecipeFilter
+    ordering_fields = ('name', 'favorites_count',)
+    read_actions = ('list', 'retrieve', 'feed', 'by_ingredients', 'similar',
+                    'recommended',)
+
+    def get_queryset(self):
+        """ Предзагрузка связанных данных для чтения рецептов. """
+        if self.action in self.read_actions:
+            return Recipe.objects.with_related()
+        return super().get_queryset()
+
+    def get_cache_tags(self):
+        """ Список зависит от всех рецептов, рецепт - от себя самого.
+        Оба - от справочников тегов и ингредиентов.
+        """
+        if self.action == 'retrieve':
+            return (f'recipe:{self.kwargs["pk"]}', 'reference')
+        return ('recipes', 'reference')
+
+    @transaction.atomic
+    def perform_destroy(self, recipe):
+        """ Удаляет рецепт. Списки покупок изменяет сигнал pre_delete. """
+        User.objects.filter(pk=recipe.author_id, recipes_count__gt=0).update(
+            recipes_count=F('recipes_count') - 1)
+        recipe.delete()
 
     def get_serializer_class(self):
         """ Выбор сериализатора для метода. """
@@ -92,37 +157,160 @@ class RecipeViewSet(ModelViewSet):
         return RecipeCreateSerializer
 
     @staticmethod
-    def get_shopping_list(ingredients):
-        """ Формирует txt файл со списком покупок и дублирует в сообщении."""
-        shopping_list = ['Список покупок:']
-        for ingredient in ingredients:
-            shopping_list += (
-                f"\n{ingredient['ingredient__name']} - "
-                f"{ingredient['amount']} "
-                f"{ingredient['ingredient__measurement_unit']}"
-            )
-        shopping_list.append('\nFoodgram - продуктовый помощник ')
-        file = 'shopping_list.txt'
-        response = HttpResponse(shopping_list,
-                                content_type='text/plain; charset=utf8')
-        response['Content-Disposition'] = f'attachment; filename={file}'
+    def get_shopping_list(renderer, ingredients):
+        """ Потоковая выгрузка списка покупок в выбранном формате. """
+        response = StreamingHttpResponse(
+            timed_stream(renderer.stream(ingredients), renderer.format),
+            content_type=renderer.content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename=shopping_list.{renderer.format}')
         return response
 
     @action(
         detail=False,
         methods=['GET'],
-        permission_classes=(IsAuthenticated,)
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=SHOPPING_LIST_RENDERERS,
     )
     def download_shopping_cart(self, request):
         """ Скачивает список покупок. """
         if not request.user.carts.exists():
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        ingredients = IngredientInRecipe.objects.filter(
-            recipe__carts__user=request.user
-        ).order_by('ingredient__name').values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
-        return self.get_shopping_list(ingredients)
+        ingredients = request.user.shopping_list.order_by(
+            'ingredient__name'
+        ).values(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        )
+        return self.get_shopping_list(
+            request.accepted_renderer,
+            ingredients.iterator(chunk_size=settings.SHOPPING_LIST_CHUNK_SIZE)
+        )
+
+    @action(
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+    )
+    def feed(self, request):
+        """ Лента рецептов авторов из подписок, новые рецепты первыми.
+
+        Следующая страница запрашивается с параметром before - id
+        последнего рецепта текущей страницы.
+        """
+        before = request.query_params.get('before')
+        if before is not None:
+            try:
+                before = int(before)
+            except ValueError:
+                raise ValidationError({'before': 'Требуется id рецепта'})
+        limit = self.paginator.get_page_size(request)
+        ids = get_feed_page(request.user.id, limit, before)
+        recipes = self.get_queryset().in_bulk(ids)
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in ids if pk in recipes], many=True)
+        next_link = None
+        if len(ids) == limit:
+            next_link = replace_query_param(
+                request.build_absolute_uri(), 'before', ids[-1])
+        return Response(OrderedDict([
+            ('next', next_link),
+            ('results', serializer.data),
+        ]))
+
+    @staticmethod
+    def get_ingredient_ids(request):
+        """ id ингредиентов из параметра ingredients: повторяющегося
+        или через запятую.
+        """
+        values = [
+            value.strip()
+            for param in request.query_params.getlist('ingredients')
+            for value in param.split(',') if value.strip()
+        ]
+        if not values:
+            raise ValidationError(
+                {'ingredients': 'Требуется указать ингредиенты'})
+        try:
+            return [int(value) for value in values]
+        except ValueError:
+            raise ValidationError(
+                {'ingredients': 'Требуются id ингредиентов'})
+
+    @action(
+        detail=False,
+        url_path='by-ingredients',
+    )
+    def by_ingredients(self, request):
+        """ Рецепты по имеющимся ингредиентам: сначала рецепты с
+        наименьшим числом недостающих ингредиентов.
+        """
+        ingredient_ids = self.get_ingredient_ids(request)
+        limit = self.paginator.get_page_size(request)
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        count, ranked = recipe_ingredient_index.search(
+            ingredient_ids, page * limit)
+        ranked = ranked[(page - 1) * limit:]
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in ranked])
+        results = []
+        for recipe_id, matched, total in ranked:
+            if recipe_id in recipes:
+                recipe = recipes[recipe_id]
+                recipe.ingredients_matched = matched
+                recipe.ingredients_total = total
+                results.append(recipe)
+        url = request.build_absolute_uri()
+        return Response(OrderedDict([
+            ('count', count),
+            ('next', replace_query_param(url, 'page', page + 1)
+             if page * limit < count else None),
+            ('previous', replace_query_param(url, 'page', page - 1)
+             if page > 1 else None),
+            ('results', RecipeCoverageSerializer(
+                results, many=True, context={'request': request}).data),
+        ]))
+
+    @action(detail=True)
+    def similar(self, request, pk):
+        """ Похожие рецепты, рассчитанные build_recommendations. """
+        try:
+            recipes = self.get_queryset().filter(
+                similar_to__recipe_id=pk,
+            ).annotate(similarity=F('similar_to__score')).order_by(
+                '-similarity')[:settings.RECOMMENDATION_TOP_K]
+        except ValueError:
+            raise Http404
+        serializer = self.get_serializer(recipes, many=True)
+        if not serializer.data:
+            get_object_or_404(Recipe.objects.only('id'), pk=pk)
+        return Response(serializer.data)
+
+    @action(detail=False)
+    def recommended(self, request):
+        """ Рецепты, похожие на избранные рецепты пользователя.
+        Не хватающие до limit - самые популярные рецепты.
+        """
+        limit = self.paginator.get_page_size(request)
+        ids = []
+        if request.user.is_authenticated:
+            ids = list(RecipeNeighbor.objects.filter(
+                recipe__favorites__user=request.user,
+            ).exclude(
+                neighbor__favorites__user=request.user,
+            ).values('neighbor').annotate(
+                total=Sum('score'),
+            ).order_by('-total').values_list('neighbor', flat=True)[:limit])
+        found = self.get_queryset().in_bulk(ids)
+        recipes = [found[pk] for pk in ids if pk in found]
+        if len(recipes) < limit:
+            popular = self.get_queryset().exclude(pk__in=ids)
+            if request.user.is_authenticated:
+                popular = popular.exclude(favorites__user=request.user)
+            recipes += popular.order_by(
+                '-favorites_count', '-id')[:limit - len(recipes)]
+        return Response(self.get_serializer(recipes, many=True).data)
 
     @staticmethod
     def add_obj(serializer_class, request, pk):
@@ -151,11 +339,13 @@ class RecipeViewSet(ModelViewSet):
         methods=['POST'],
         permission_classes=(IsAuthenticated,)
     )
+    @transaction.atomic
     def shopping_cart(self, request, pk):
         """ Добавляет рецепт в список покупок. """
         return self.add_obj(CartSerializer, request, pk)
 
     @shopping_cart.mapping.delete
+    @transaction.atomic
     def del_from_shopping_cart(self, request, pk):
         """ Удаляет рецепт из списка покупок. """
         return self.delete_obj(Cart, request, pk)
@@ -165,11 +355,31 @@ class RecipeViewSet(ModelViewSet):
         methods=['POST'],
         permission_classes=(IsAuthenticated,)
     )
+    @transaction.atomic
     def favorite(self, request, pk):
         """ Добавляет рецепт в список избранных рецептов. """
+        Recipe.objects.filter(pk=pk).update(
+            favorites_count=F('favorites_count') + 1,
+            neighbors_outdated=True)
         return self.add_obj(FavoriteSerializer, request, pk)
 
     @favorite.mapping.delete
+    @transaction.atomic
     def del_from_favorite(self, request, pk):
         """ Удаляет рецепт из списка избранных рецептов. """
+        Recipe.objects.filter(pk=pk, favorites_count__gt=0).update(
+            favorites_count=F('favorites_count') - 1,
+            neighbors_outdated=True)
         return self.delete_obj(Favorite, request, pk)
+
+
+class ProfilingStatsView(APIView):
+    """ Статистика профилирования запросов текущего процесса. """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(stats.snapshot())
+
+    def delete(self, request):
+        stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
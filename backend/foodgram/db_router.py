@@ -0,0 +1,137 @@
+""" Чтение из реплик БД.
+
+ReplicaMiddleware отмечает запросы безопасными методами (GET, HEAD,
+OPTIONS) к ViewSet из DATABASE_REPLICA_VIEWS, ReplicaRouter направляет
+чтение моделей приложений DATABASE_REPLICA_APPS в таких запросах
+в случайную реплику из DATABASE_REPLICAS. Запись, чтение внутри
+транзакции, токены аутентификации (новый токен может еще не дойти
+до реплики) и остальные запросы используют основную БД.
+
+После успешного запроса на изменение (избранное, список покупок,
+рецепты) клиент закрепляется за основной БД на DATABASE_REPLICA_PIN
+секунд, чтобы видеть свои изменения, пока они не дошли до реплик.
+Клиент определяется по заголовку Authorization, метка хранится в кеше
+Django и действует во всех процессах с общим кешем. Данные, которые
+сохраняются надолго (справочники и ленты в кеше, множества ViewerState,
+индексы в памяти), строятся по основной БД (primary_reads): построенные
+по отстающей реплике, они оставались бы устаревшими и после того, как
+реплика догонит основную БД. Ответы для анонимных пользователей
+(api.cache) могут быть построены по реплике с отставанием и хранятся
+не дольше ANONYMOUS_CACHE_TIMEOUT.
+"""
+import asyncio
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def primary_reads():
+    """ Чтение из основной БД внутри блока или декорированной функции. """
+    token = replica_reads.set(False)
+    try:
+        yield
+    finally:
+        replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    """ Чтение в отмеченных запросах - из реплик, остальное - из основной
+    БД.
+    """
+
+    def db_for_read(self, model, **hints):
+        if (not replica_reads.get() or not settings.DATABASE_REPLICAS
+                or model._meta.app_label not in settings.DATABASE_REPLICA_APPS
+                or transaction.get_connection(
+                    DEFAULT_DB_ALIAS).in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная БД.
+        return True
+
+
+def pin_cache_key(request):
+    """ Ключ метки закрепления клиента за основной БД или None для
+    анонимного клиента.
+    """
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if not authorization:
+        return None
+    return f'db-pin:{hashlib.sha1(authorization.encode()).hexdigest()}'
+
+
+class ReplicaMiddleware:
+    """ Отмечает запросы, чтение в которых можно выполнять в репликах,
+    и закрепляет клиента за основной БД после изменений.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        else:
+            self._is_coroutine = None
+
+    def __call__(self, request):
+        if self._is_coroutine:
+            return self.__acall__(request)
+        token = replica_reads.set(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        key = self.get_pin_key(request, response)
+        if key is not None:
+            cache.set(key, True, settings.DATABASE_REPLICA_PIN)
+        return response
+
+    async def __acall__(self, request):
+        token = replica_reads.set(False)
+        try:
+            response = await self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        key = self.get_pin_key(request, response)
+        if key is not None:
+            await cache.aset(key, True, settings.DATABASE_REPLICA_PIN)
+        return response
+
+    @staticmethod
+    def get_pin_key(request, response):
+        """ Ключ метки, если клиента нужно закрепить за основной БД после
+        изменений.
+        """
+        if (not settings.DATABASE_REPLICAS
+                or request.method in SAFE_METHODS
+                or response.status_code >= 400):
+            return None
+        return pin_cache_key(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None)
+        if (not settings.DATABASE_REPLICAS
+                or request.method not in SAFE_METHODS
+                or view_class is None
+                or view_class.__name__ not in settings.DATABASE_REPLICA_VIEWS):
+            return
+        key = pin_cache_key(request)
+        if key is None or not cache.get(key):
+            replica_reads.set(True)
@@ -0,0 +1,100 @@
+""" Метрики приложения в формате Prometheus.
+
+Значения собирает ProfilingMiddleware (запросы, SQL) и код приложений
+(кеш, список покупок, изображения, создание объектов), отдает
+представление metrics_view по адресу /metrics. Адрес не проксируется
+nginx и доступен только внутри сети docker-compose.
+
+С переменной окружения PROMETHEUS_MULTIPROC_DIR значения хранятся
+в файлах каталога и суммируются по всем процессам gunicorn. Переменная
+должна быть задана до запуска gunicorn, каталог очищается при старте
+(gunicorn.conf.py).
+"""
+import os
+import time
+
+from django.http import HttpResponse
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+
+REQUESTS = Counter(
+    'foodgram_http_requests_total',
+    'Запросы по обработчикам и статусам ответа',
+    ('route', 'method', 'status'),
+)
+REQUEST_DURATION = Histogram(
+    'foodgram_http_request_duration_seconds',
+    'Время ответа',
+    ('route', 'method'),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+DB_QUERIES = Histogram(
+    'foodgram_http_request_db_queries',
+    'SQL-запросов за запрос',
+    ('route',),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200),
+)
+DB_DURATION = Counter(
+    'foodgram_db_query_duration_seconds_total',
+    'Время выполнения SQL-запросов',
+    ('route',),
+)
+CACHE_LOOKUPS = Counter(
+    'foodgram_cache_lookups_total',
+    'Обращения к кешу: hit - данные найдены, miss - построены заново',
+    ('cache', 'result'),
+)
+SHOPPING_LIST_DURATION = Histogram(
+    'foodgram_shopping_list_duration_seconds',
+    'Время формирования файла списка покупок',
+    ('format',),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+IMAGE_UPLOAD_BYTES = Histogram(
+    'foodgram_image_upload_bytes',
+    'Размер загруженных изображений рецептов',
+    buckets=(2 ** 14, 2 ** 16, 2 ** 18, 2 ** 19, 2 ** 20, 2 ** 21, 2 ** 22,
+             2 ** 23, 2 ** 24),
+)
+OBJECTS_CREATED = Counter(
+    'foodgram_objects_created_total',
+    'Созданные рецепты, избранное и корзины',
+    ('model',),
+)
+
+
+def observe_request(profile, method, status_code):
+    """ Метрики запроса по измерениям ProfilingMiddleware. """
+    route = profile.endpoint
+    REQUESTS.labels(route, method, status_code).inc()
+    REQUEST_DURATION.labels(route, method).observe(profile.total)
+    DB_QUERIES.labels(route).observe(profile.queries.count)
+    DB_DURATION.labels(route).inc(profile.queries.duration)
+
+
+def cache_lookup(name, hit):
+    """ Учитывает попадание или промах кеша. """
+    CACHE_LOOKUPS.labels(name, 'hit' if hit else 'miss').inc()
+
+
+def timed_stream(chunks, file_format):
+    """ Итератор частей файла списка покупок с замером времени до конца
+    выгрузки.
+    """
+    start = time.perf_counter()
+    try:
+        yield from chunks
+    finally:
+        SHOPPING_LIST_DURATION.labels(file_format).observe(
+            time.perf_counter() - start)
+
+
+def metrics_view(request):
+    """ Метрики в текстовом формате Prometheus. """
+    registry = REGISTRY
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return HttpResponse(
+        generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
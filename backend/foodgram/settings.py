@@ -39,11 +39,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'foodgram.db_router.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -68,6 +70,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
+SERVER_MODE = os.getenv('SERVER_MODE', default='wsgi').lower()
+ASYNC_READ_VIEWS = SERVER_MODE == 'asgi'
+
 if os.getenv('TEST_DB', default='False') == 'True':
     DATABASES = {
         'default': {
@@ -84,7 +89,59 @@ else:
             'USER': os.getenv('POSTGRES_USER', default='foodgram'),
             'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='1105'),
             'HOST': os.getenv('DB_HOST', default='localhost'),
-            'PORT': os.getenv('DB_PORT', default=5433)
+            'PORT': os.getenv('DB_PORT', default=5433),
+            # Соединение используется повторно в течение DB_CONN_MAX_AGE
+            # секунд. В режиме ASGI соединения создаются в потоках запросов
+            # и не переиспользуются, повторно используются соединения
+            # пулера (DB_PGBOUNCER).
+            'CONN_MAX_AGE': int(os.getenv(
+                'DB_CONN_MAX_AGE',
+                default=0 if SERVER_MODE == 'asgi' else 60)),
+            'CONN_HEALTH_CHECKS': os.getenv(
+                'DB_CONN_HEALTH_CHECKS', default='TRUE').upper() == 'TRUE',
+            # pgbouncer в режиме transaction не поддерживает курсоры
+            # на стороне сервера (QuerySet.iterator()).
+            'DISABLE_SERVER_SIDE_CURSORS': os.getenv(
+                'DB_PGBOUNCER', default='FALSE').upper() == 'TRUE',
+        }
+    }
+
+# Реплики для чтения (foodgram.db_router): имена файлов SQLite для TEST_DB,
+# иначе адреса host[:port] с теми же параметрами, что у основной БД.
+DATABASE_REPLICAS = []
+for number, location in enumerate(filter(None, os.getenv(
+        'DB_REPLICAS', default='').split(',')), start=1):
+    replica = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    if replica['ENGINE'] == 'django.db.backends.sqlite3':
+        replica['NAME'] = os.path.join(BASE_DIR, location.strip())
+    else:
+        host, _, port = location.strip().partition(':')
+        replica.update(HOST=host, PORT=port or replica['PORT'])
+    DATABASES[f'replica{number}'] = replica
+    DATABASE_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['foodgram.db_router.ReplicaRouter']
+DATABASE_REPLICA_VIEWS = ('RecipeViewSet', 'TagViewSet', 'IngredientViewSet')
+DATABASE_REPLICA_APPS = ('recipes', 'users')
+DATABASE_REPLICA_PIN = int(os.getenv('DB_REPLICA_PIN', default=10))
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+elif os.getenv('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         }
     }
 
@@ -146,3 +203,44 @@ MAX_LEN_HEX_FIELD = 7
 MAX_LEN_MODEL_FIELD = 200
 MIN_COOKING_TIME = 1
 MIN_INGR_AMOUNT = 1
+MAX_PAGE_SIZE = 100
+INGREDIENT_SEARCH_LIMIT = 50
+SUBSCRIPTION_RECIPES_LIMIT = 50
+REFERENCE_CACHE_MAX_AGE = 60 * 60 * 24
+REFERENCE_CACHE_TIMEOUT = 60 * 60
+SHOPPING_LIST_CHUNK_SIZE = 2000
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+FILE_CHUNK_SIZE = 64 * 1024
+BULK_BATCH_SIZE = 1000
+IMAGE_PIPELINE_WORKERS = int(os.getenv('IMAGE_PIPELINE_WORKERS', default=2))
+IMAGE_VERSION_WIDTHS = (320, 640, 1280)
+IMAGE_THUMB_WIDTH = 320
+IMAGE_WEBP_QUALITY = 80
+FEED_FANOUT_MAX_FOLLOWERS = 1000
+FEED_MAX_LENGTH = 500
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+FEED_MAX_CHANGES = 50
+VIEWER_STATE_TIMEOUT = 60 * 60
+# Сброс версии в кеше процесса (LocMemCache) не виден другим процессам,
+# поэтому множества ViewerState кешируются только в общем кеше.
+VIEWER_STATE_CACHE = CACHES['default']['BACKEND'] != (
+    'django.core.cache.backends.locmem.LocMemCache')
+ANONYMOUS_CACHE_TIMEOUT = 60 * 5
+SEARCH_CONFIG = os.getenv('SEARCH_CONFIG', default='russian')
+INDEX_CHANGES_TIMEOUT = 60 * 60
+RECOMMENDATION_WEIGHTS = {'ingredients': 0.6, 'favorites': 0.3, 'tags': 0.1}
+RECOMMENDATION_TOP_K = 20
+RECOMMENDATION_MAX_DF = 0.01
+RECOMMENDATION_MIN_COMMON = 100
+RECOMMENDATION_BATCH_SIZE = 1000
+PROFILING_ENABLED = os.getenv(
+    'PROFILING_ENABLED', default='TRUE').upper() == 'TRUE'
+PROFILING_SERVER_TIMING = os.getenv(
+    'PROFILING_SERVER_TIMING', default=str(DEBUG)).upper() == 'TRUE'
+PROFILING_LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+PROFILING_DUPLICATE_THRESHOLD = 3
+PROFILING_MAX_DUPLICATES = 20
+METRICS_ENABLED = os.getenv(
+    'METRICS_ENABLED', default='TRUE').upper() == 'TRUE'
@@ -0,0 +1,109 @@
+""" Настройки gunicorn.
+
+Профиль выбирается переменной GUNICORN_PROFILE (PROFILES), отдельные
+значения профиля переопределяются переменными окружения:
+WEB_CONCURRENCY - число процессов, GUNICORN_THREADS - потоков в процессе
+gthread, GUNICORN_MAX_REQUESTS - запросов до перезапуска процесса,
+GUNICORN_TIMEOUT - секунд до принудительного перезапуска зависшего
+процесса, GUNICORN_PRELOAD - загрузка приложения до создания процессов.
+
+С preload_app приложение загружается в главном процессе, индексы
+в памяти строятся до создания процессов (when_ready), и процессы
+разделяют эти страницы памяти (copy-on-write).
+
+SERVER_MODE=asgi запускает приложение ASGI в процессах uvicorn
+с асинхронными обработчиками чтения (api.async_views), число потоков
+профиля не используется. По умолчанию - приложение WSGI.
+
+Каталог PROMETHEUS_MULTIPROC_DIR очищается при запуске, файлы метрик
+завершившихся процессов объединяются в общие значения.
+"""
+import gc
+import multiprocessing
+import os
+import shutil
+
+from prometheus_client import multiprocess
+
+CPUS = multiprocessing.cpu_count()
+
+PROFILES = {
+    # Процесс на запрос: предсказуемое время ответа, больше памяти.
+    'sync': {
+        'worker_class': 'sync', 'workers': 2 * CPUS + 1, 'threads': 1,
+        'preload_app': True,
+    },
+    # Потоки в процессе: ожидание БД и кеша не блокирует процесс.
+    'gthread': {
+        'worker_class': 'gthread', 'workers': CPUS + 1, 'threads': 4,
+        'preload_app': True,
+    },
+    # Минимум процессов для небольшого сервера.
+    'small': {
+        'worker_class': 'gthread', 'workers': 2, 'threads': 8,
+        'preload_app': True,
+    },
+    # Один процесс без предзагрузки, код перезагружается при изменении.
+    'dev': {
+        'worker_class': 'sync', 'workers': 1, 'threads': 1,
+        'preload_app': False, 'reload': True,
+    },
+}
+
+profile = PROFILES[os.getenv('GUNICORN_PROFILE', 'gthread')]
+
+bind = '0:8001'
+workers = int(os.getenv('WEB_CONCURRENCY', profile['workers']))
+threads = int(os.getenv('GUNICORN_THREADS', profile['threads']))
+worker_class = profile['worker_class']
+preload_app = os.getenv(
+    'GUNICORN_PRELOAD', str(profile['preload_app'])).upper() == 'TRUE'
+reload = profile.get('reload', False)
+
+# Перезапуск процессов ограничивает рост памяти, разброс - чтобы процессы
+# не перезапускались одновременно.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+# Файлы контроля процессов в памяти, а не на overlay-диске контейнера.
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+accesslog = '-'
+access_log_format = '%(h)s "%(r)s" %(s)s %(b)s %(M)sms'
+
+if os.getenv('SERVER_MODE', 'wsgi').lower() == 'asgi':
+    wsgi_app = 'foodgram.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'foodgram.wsgi:application'
+
+
+def on_starting(server):
+    directory = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    from django.db import DatabaseError, connections
+    from recipes.indexes import ingredient_index, recipe_ingredient_index
+    try:
+        ingredient_index.ensure_built()
+        recipe_ingredient_index.ensure_built()
+    except DatabaseError as error:
+        server.log.warning('Индексы не построены до запуска: %s', error)
+    # Соединения главного процесса не должны наследоваться процессами.
+    connections.close_all()
+    # Объекты, созданные до запуска процессов, не обходит сборщик мусора,
+    # и их страницы памяти не копируются в процессах.
+    gc.freeze()
+
+
+def child_exit(server, worker):
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(worker.pid)
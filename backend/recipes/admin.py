@@ -1,7 +1,9 @@
 """ Модуль для администрирования приложения `recipes`. """
 from django.contrib import admin
 
-from .models import Cart, Favorite, Ingredient, IngredientInRecipe, Recipe, Tag
+from . import search
+from .models import (Cart, Favorite, Ingredient, IngredientInRecipe, Recipe,
+                     ShoppingListItem, Tag)
 
 
 @admin.register(Ingredient)
@@ -32,14 +34,22 @@ class RecipeAdmin(admin.ModelAdmin):
     list_display = (
         'author', 'name', 'cooking_time', 'count_favorites', 'ingredients_list'
     )
-    search_fields = ('name', 'slug',)
+    search_fields = ('name',)
     list_filter = ('name', 'author', 'tags',)
+    readonly_fields = ('favorites_count',)
     inlines = (IngredientInLine,)
 
-    @admin.display(description='Добавлено в избранное')
+    def get_search_results(self, request, queryset, search_term):
+        """ Поиск по полнотекстовому индексу рецептов. """
+        if not search_term:
+            return queryset, False
+        return search.search(queryset, search_term), False
+
+    @admin.display(description='Добавлено в избранное',
+                   ordering='favorites_count')
     def count_favorites(self, recipe):
         """ Общее число добавлений рецепта в избранное """
-        return recipe.favorites.count()
+        return recipe.favorites_count
 
 
 @admin.register(Favorite)
@@ -54,3 +64,11 @@ class CartAdmin(admin.ModelAdmin):
     """ Управление корзиной """
     list_display = ('recipe', 'user',)
     search_fields = ('recipe ', 'user',)
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    """ Просмотр сводных списков покупок """
+    list_display = ('user', 'ingredient', 'amount',)
+    search_fields = ('user__username', 'ingredient__name',)
+    readonly_fields = ('user', 'ingredient', 'amount',)
@@ -0,0 +1,119 @@
+""" Обработка изображений рецептов в фоновом пуле потоков.
+
+Оригинал изображения сохраняется в запросе, а уменьшенные копии в формате
+WebP создаются после фиксации транзакции в пуле потоков. До окончания
+обработки API отдает ссылку на оригинал.
+
+Recipe.image_versions:
+    {'source': имя оригинала, 'sizes': {ширина: имя файла копии}}.
+    Копии действительны, только пока source совпадает с Recipe.image.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    """ Пул потоков обработки, создается при первом использовании. """
+    return ThreadPoolExecutor(
+        max_workers=settings.IMAGE_PIPELINE_WORKERS,
+        thread_name_prefix='recipe-images',
+    )
+
+
+def version_name(source, width):
+    """ Имя файла уменьшенной копии изображения. """
+    path = PurePosixPath(source)
+    return str(path.parent / 'versions' / f'{path.stem}-{width}.webp')
+
+
+def render_versions(source):
+    """ Создает копии изображения в WebP для ширин из настроек.
+
+    Изображение не увеличивается: ширины больше оригинала заменяются
+    одной копией в размере оригинала.
+    """
+    with default_storage.open(source) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    widths = sorted({
+        min(width, image.width) for width in settings.IMAGE_VERSION_WIDTHS})
+    sizes = {}
+    for width in widths:
+        copy = image.copy()
+        copy.thumbnail((width, image.height), Image.Resampling.LANCZOS)
+        buffer = BytesIO()
+        copy.save(buffer, 'WEBP', quality=settings.IMAGE_WEBP_QUALITY)
+        name = version_name(source, width)
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        sizes[str(width)] = default_storage.save(
+            name, ContentFile(buffer.getvalue()))
+    return sizes
+
+
+def process(recipe_id, source):
+    """ Обрабатывает изображение рецепта и сохраняет имена копий.
+
+    Копии не записываются, если изображение рецепта уже заменено.
+    """
+    sizes = render_versions(source)
+    Recipe.objects.filter(pk=recipe_id, image=source).update(
+        image_versions={'source': source, 'sizes': sizes})
+
+
+def process_in_worker(recipe_id, source):
+    """ Обработка в потоке пула: соединение с БД потока закрывается,
+    чтобы не оставаться открытым между задачами.
+    """
+    try:
+        process(recipe_id, source)
+    finally:
+        connection.close()
+
+
+def log_error(future):
+    """ Записывает в лог ошибку фоновой обработки. """
+    error = future.exception()
+    if error is not None:
+        logger.error('Ошибка обработки изображения рецепта',
+                     exc_info=(type(error), error, error.__traceback__))
+
+
+def schedule(recipe):
+    """ Ставит изображение рецепта в очередь после фиксации транзакции.
+
+    При IMAGE_PIPELINE_WORKERS = 0 обработка выполняется синхронно.
+    """
+    recipe_id, source = recipe.pk, recipe.image.name
+
+    def submit():
+        if not settings.IMAGE_PIPELINE_WORKERS:
+            process(recipe_id, source)
+            return
+        get_executor().submit(
+            process_in_worker, recipe_id, source,
+        ).add_done_callback(log_error)
+
+    transaction.on_commit(submit)
+
+
+def is_current(recipe):
+    """ Копии изображения соответствуют текущему оригиналу. """
+    versions = recipe.image_versions or {}
+    return bool(recipe.image) and versions.get('source') == recipe.image.name
@@ -0,0 +1,250 @@
+""" Индексы в памяти процесса для приложения `recipes`.
+
+Classes:
+    InMemoryIndex:
+        Базовый класс индекса с ленивым построением и версией в кеше.
+    IngredientSearchIndex:
+        Поиск ингредиентов по началу и вхождению в название.
+    RecipeIngredientIndex:
+        Обратный индекс ингредиент -> рецепты для подбора рецептов
+        по имеющимся ингредиентам.
+"""
+import heapq
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+# noqa I004
+from foodgram.db_router import primary_reads  # noqa I001
+from foodgram.metrics import cache_lookup  # noqa I001
+
+from .models import Ingredient, IngredientInRecipe
+
+
+class InMemoryIndex:
+    """ Базовый класс индекса в памяти процесса.
+
+    Индекс строится при первом обращении. Версия индекса хранится в кеше
+    Django: invalidate() увеличивает ее, и все процессы, использующие
+    общий кеш, перестраивают индекс при следующем обращении.
+
+    Если max_changes больше нуля, invalidate() принимает id измененных
+    объектов и сохраняет их в кеше под номером версии. Процесс, отставший
+    не больше чем на max_changes версий, обновляет только эти объекты
+    методом update(), иначе индекс перестраивается полностью.
+    """
+    cache_key = None
+    max_changes = 0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+
+    def build(self):
+        """ Строит данные индекса. Переопределяется в наследниках. """
+        raise NotImplementedError
+
+    def update(self, changed):
+        """ Обновляет данные индекса для измененных объектов. """
+        raise NotImplementedError
+
+    def change_key(self, version):
+        return f'{self.cache_key}:{version}'
+
+    def invalidate(self, changed=None):
+        """ Помечает индекс устаревшим. """
+        try:
+            version = cache.incr(self.cache_key)
+        except ValueError:
+            version = 1
+            cache.set(self.cache_key, version, None)
+        if changed is not None and self.max_changes:
+            cache.set(self.change_key(version), list(changed),
+                      settings.INDEX_CHANGES_TIMEOUT)
+
+    def get_changes(self, version):
+        """ id объектов, измененных после построения индекса, или None,
+        если требуется полное перестроение.
+        """
+        if (self._version is None
+                or not 0 < version - self._version <= self.max_changes):
+            return None
+        keys = [self.change_key(number)
+                for number in range(self._version + 1, version + 1)]
+        changes = cache.get_many(keys)
+        if len(changes) != len(keys):
+            return None
+        return set().union(*changes.values())
+
+    def ensure_built(self):
+        """ Перестраивает индекс, если его версия устарела. """
+        version = cache.get(self.cache_key, 0)
+        cache_lookup(type(self).__name__, self._version == version)
+        if self._version == version:
+            return
+        with self._lock, primary_reads():
+            if self._version == version:
+                return
+            changed = self.get_changes(version)
+            if changed is None:
+                self.build()
+            else:
+                self.update(changed)
+            self._version = version
+
+
+class IngredientSearchIndex(InMemoryIndex):
+    """ Индекс для поиска ингредиентов по названию.
+
+    Названия приводятся к casefold и сортируются: поиск по началу
+    названия выполняется бинарным поиском, поиск по вхождению - по
+    пересечению списков позиций триграмм запроса.
+    """
+    cache_key = 'index:ingredients:version'
+
+    def __init__(self):
+        super().__init__()
+        self._state = ((), (), {})
+
+    def build(self):
+        rows = sorted(
+            Ingredient.objects.values_list('id', 'name', 'measurement_unit'),
+            key=lambda row: (row[1].casefold(), row[0]),
+        )
+        items = tuple(
+            Ingredient(id=pk, name=name, measurement_unit=measurement_unit)
+            for pk, name, measurement_unit in rows
+        )
+        names = tuple(name.casefold() for _, name, _ in rows)
+        postings = defaultdict(list)
+        for position, name in enumerate(names):
+            for trigram in self.trigrams(name):
+                postings[trigram].append(position)
+        self._state = (items, names, dict(postings))
+
+    @staticmethod
+    def trigrams(value):
+        """ Множество триграмм строки. """
+        return {value[i:i + 3] for i in range(len(value) - 2)}
+
+    def search(self, value, limit=None):
+        """ Ингредиенты, название которых начинается с value, затем
+        ингредиенты, содержащие value в произвольном месте.
+        """
+        self.ensure_built()
+        items, names, postings = self._state
+        limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+        value = value.casefold()
+
+        result = []
+        position = bisect_left(names, value)
+        while (position < len(names) and len(result) < limit
+               and names[position].startswith(value)):
+            result.append(items[position])
+            position += 1
+        if len(result) >= limit:
+            return result
+
+        trigrams = self.trigrams(value)
+        if trigrams:
+            candidates = sorted(set.intersection(*sorted(
+                (set(postings.get(trigram, ())) for trigram in trigrams),
+                key=len,
+            )))
+        else:
+            candidates = range(len(names))
+        for position in candidates:
+            name = names[position]
+            if value in name and not name.startswith(value):
+                result.append(items[position])
+                if len(result) >= limit:
+                    break
+        return result
+
+
+class RecipeIngredientIndex(InMemoryIndex):
+    """ Обратный индекс ингредиентов рецептов.
+
+    Для каждого ингредиента хранится отсортированный массив id рецептов,
+    для каждого рецепта - id его ингредиентов. Изменения рецептов
+    применяются к индексу инкрементально.
+    """
+    cache_key = 'index:recipe_ingredients:version'
+    max_changes = 1000
+
+    def __init__(self):
+        super().__init__()
+        self._postings = {}
+        self._recipes = {}
+
+    def build(self):
+        postings = defaultdict(lambda: array('q'))
+        recipes = defaultdict(list)
+        rows = IngredientInRecipe.objects.order_by(
+            'ingredient_id', 'recipe_id'
+        ).values_list('ingredient_id', 'recipe_id')
+        for ingredient_id, recipe_id in rows.iterator(
+                chunk_size=settings.BULK_BATCH_SIZE):
+            postings[ingredient_id].append(recipe_id)
+            recipes[recipe_id].append(ingredient_id)
+        self._postings = dict(postings)
+        self._recipes = {
+            recipe_id: tuple(sorted(ingredient_ids))
+            for recipe_id, ingredient_ids in recipes.items()
+        }
+
+    def update(self, changed):
+        """ Перечитывает ингредиенты измененных рецептов. Массивы
+        заменяются копиями, чтобы не менять их во время поиска.
+        """
+        current = defaultdict(set)
+        for recipe_id, ingredient_id in IngredientInRecipe.objects.filter(
+            recipe_id__in=changed
+        ).values_list('recipe_id', 'ingredient_id'):
+            current[recipe_id].add(ingredient_id)
+        for recipe_id in changed:
+            old = set(self._recipes.get(recipe_id, ()))
+            new = current.get(recipe_id, set())
+            for ingredient_id in old - new:
+                recipe_ids = array('q', self._postings[ingredient_id])
+                del recipe_ids[bisect_left(recipe_ids, recipe_id)]
+                if recipe_ids:
+                    self._postings[ingredient_id] = recipe_ids
+                else:
+                    del self._postings[ingredient_id]
+            for ingredient_id in new - old:
+                recipe_ids = array(
+                    'q', self._postings.get(ingredient_id, ()))
+                insort(recipe_ids, recipe_id)
+                self._postings[ingredient_id] = recipe_ids
+            if new:
+                self._recipes[recipe_id] = tuple(sorted(new))
+            else:
+                self._recipes.pop(recipe_id, None)
+
+    def search(self, ingredient_ids, limit):
+        """ Рецепты с наибольшим покрытием набора ингредиентов.
+
+        Возвращает число найденных рецептов и не больше limit кортежей
+        (id рецепта, ингредиентов из набора, всего ингредиентов). Первыми
+        идут рецепты с наименьшим числом недостающих ингредиентов, затем
+        с наибольшим числом совпадений, затем новые.
+        """
+        self.ensure_built()
+        postings, recipes = self._postings, self._recipes
+        matched = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matched.update(postings.get(ingredient_id, ()))
+        ranked = heapq.nsmallest(limit, matched.items(), key=lambda item: (
+            len(recipes.get(item[0], ())) - item[1], -item[1], -item[0]))
+        return len(matched), [
+            (recipe_id, count, len(recipes.get(recipe_id, ())))
+            for recipe_id, count in ranked
+        ]
+
+
+ingredient_index = IngredientSearchIndex()
+recipe_ingredient_index = RecipeIngredientIndex()
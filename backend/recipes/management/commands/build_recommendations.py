@@ -0,0 +1,68 @@
+import resource
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+# noqa I004
+from recipes import recommendations
+
+
+class Command(BaseCommand):
+    help = (' Расчет похожих рецептов. По умолчанию пересчитываются только '
+            'измененные рецепты и связанные с ними. ')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать похожие рецепты для всех рецептов',
+        )
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=settings.RECOMMENDATION_TOP_K,
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.RECOMMENDATION_BATCH_SIZE,
+        )
+        parser.add_argument(
+            '--synthetic',
+            type=int,
+            metavar='N',
+            help='Расчет на N случайных рецептах без записи в БД '
+                 'для оценки времени и памяти',
+        )
+
+    def handle(self, *args, **options):
+        tracemalloc.start()
+        start = time.perf_counter()
+        if options['synthetic']:
+            features = recommendations.synthetic_features(
+                options['synthetic'])
+            loaded = time.perf_counter()
+            processed = pairs = 0
+            for _, columns, _ in features.top_neighbors(
+                    range(options['synthetic']), options['top_k'],
+                    options['batch_size']):
+                processed += 1
+                pairs += len(columns)
+            self.stdout.write(
+                f'- признаки: {loaded - start:.1f} с, '
+                f'похожих пар: {pairs}')
+        else:
+            processed = recommendations.build(
+                full=options['full'],
+                top_k=options['top_k'],
+                batch_size=options['batch_size'],
+            )
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.stdout.write(self.style.SUCCESS(
+            f'- пересчитано {processed} рецептов за {elapsed:.1f} с, '
+            f'пик выделенной памяти {peak / 2 ** 20:.0f} МБ, '
+            f'RSS {max_rss / 1024:.0f} МБ'))
@@ -1,31 +1,177 @@
+import csv
 import json
+from io import StringIO
+from itertools import islice
+from pathlib import Path
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 # noqa I004
 from recipes.models import Ingredient, Tag
+from recipes.signals import data_loaded
+
+DATA_DIR = Path(settings.BASE_DIR, 'api', 'static', 'data')
 
 TABLES = {
     Ingredient: 'ingredients.json',
     Tag: 'tags.json',
 }
 
+FIELDS = {
+    Ingredient: ('name', 'measurement_unit'),
+    Tag: ('name', 'color', 'slug'),
+}
+
+MODELS = {model._meta.model_name: model for model in TABLES}
+
+
+def iter_json(file, chunk_size=64 * 1024):
+    """ Потоковое чтение элементов JSON-массива из файла. """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    for chunk in iter(lambda: file.read(chunk_size), ''):
+        buffer += chunk
+        while True:
+            buffer = buffer.lstrip()
+            if not started:
+                if not buffer:
+                    break
+                if buffer[0] != '[':
+                    raise CommandError('Ожидается JSON-массив')
+                buffer = buffer[1:]
+                started = True
+                continue
+            if buffer[:1] in (',', ']'):
+                buffer = buffer[1:]
+                continue
+            try:
+                element, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                break
+            yield element
+            buffer = buffer[end:]
+    if buffer.strip():
+        raise CommandError('Некорректный JSON в конце файла')
+
+
+def iter_csv(file, fields):
+    """ Чтение CSV: с заголовком из имен полей или без заголовка. """
+    reader = csv.reader(file)
+    first = next(reader, None)
+    if first is None:
+        return
+    if tuple(first) != fields:
+        yield dict(zip(fields, first))
+    for row in reader:
+        yield dict(zip(fields, row))
+
+
+def batches(iterable, size):
+    """ Разбивает итератор на списки длиной size. """
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
 
 class Command(BaseCommand):
-    help = ' Загрузка тестовых данных. '
+    help = (' Загрузка тестовых данных. Повторная загрузка пропускает '
+            'уже существующие записи. ')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            help='Файл JSON или CSV. По умолчанию загружаются теги и '
+                 'ингредиенты из api/static/data',
+        )
+        parser.add_argument(
+            '--model',
+            choices=sorted(MODELS),
+            default='ingredient',
+            help='Модель для данных из --file',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.BULK_BATCH_SIZE,
+        )
+        parser.add_argument(
+            '--no-copy',
+            action='store_true',
+            help='Не использовать COPY для PostgreSQL',
+        )
 
     def handle(self, *args, **options):
-        for model, json_file in TABLES.items():
-            self.stdout.write(f'Импорт данных из файла {json_file}')
-            with open(f'{settings.BASE_DIR}/api/static/data/{json_file}',
-                      encoding='utf-8',) as file:
-                counter = 0
-                test_data = json.loads(file.read())
-                for element in test_data:
-                    _, created = model.objects.get_or_create(**element)
-                    if created:
-                        counter += 1
-                    self.stdout.write(self.style.WARNING(
-                        f'{element} уже загружен'))
+        if options['file']:
+            tables = {MODELS[options['model']]: Path(options['file'])}
+        else:
+            tables = {
+                model: DATA_DIR / file for model, file in TABLES.items()}
+        use_copy = (connection.vendor == 'postgresql'
+                    and not options['no_copy'])
+        for model, path in tables.items():
+            self.stdout.write(f'Импорт данных из файла {path.name}')
+            created, skipped = self.load(
+                model, path, options['batch_size'], use_copy)
+            data_loaded.send(sender=model)
             self.stdout.write(self.style.SUCCESS(
-                f'- загружено {counter} записей'))
+                f'- загружено {created} записей, пропущено {skipped}'))
+
+    def load(self, model, path, batch_size, use_copy):
+        """ Загружает файл, возвращает число созданных и пропущенных
+        записей.
+        """
+        fields = FIELDS[model]
+        with open(path, encoding='utf-8', newline='') as file:
+            if path.suffix.lower() == '.csv':
+                rows = iter_csv(file, fields)
+            else:
+                rows = iter_json(file)
+            with transaction.atomic():
+                before = model.objects.count()
+                seen = set(model.objects.values_list(*fields))
+                total = 0
+                for batch in batches(rows, batch_size):
+                    total += len(batch)
+                    new = []
+                    for row in batch:
+                        key = tuple(str(row[field]) for field in fields)
+                        if key not in seen:
+                            seen.add(key)
+                            new.append(key)
+                    if use_copy:
+                        self.copy(model, fields, new)
+                    else:
+                        model.objects.bulk_create(
+                            (model(**dict(zip(fields, key))) for key in new),
+                            batch_size=batch_size,
+                            ignore_conflicts=True,
+                        )
+                created = model.objects.count() - before
+        return created, total - created
+
+    @staticmethod
+    def copy(model, fields, rows):
+        """ Загрузка через COPY во временную таблицу и INSERT без
+        конфликтующих записей.
+        """
+        if not rows:
+            return
+        table = model._meta.db_table
+        columns = ', '.join(fields)
+        buffer = StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE IF NOT EXISTS load_{table} '
+                f'ON COMMIT DROP AS SELECT {columns} FROM {table} '
+                f'WITH NO DATA')
+            cursor.copy_expert(
+                f'COPY load_{table} ({columns}) FROM STDIN WITH (FORMAT csv)',
+                buffer)
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) '
+                f'SELECT {columns} FROM load_{table} ON CONFLICT DO NOTHING')
+            cursor.execute(f'TRUNCATE load_{table}')
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+# noqa I004
+from recipes import images
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (' Создание уменьшенных копий изображений рецептов, для которых '
+            'они отсутствуют или устарели. ')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать копии для всех рецептов',
+        )
+
+    def handle(self, *args, **options):
+        processed = failed = 0
+        recipes = Recipe.objects.exclude(image='').only(
+            'id', 'image', 'image_versions').order_by('id')
+        for recipe in recipes.iterator():
+            if not options['all'] and images.is_current(recipe):
+                continue
+            try:
+                images.process(recipe.id, recipe.image.name)
+            except OSError as error:
+                failed += 1
+                self.stderr.write(f'- рецепт {recipe.id}: {error}')
+                continue
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'- обработано {processed} изображений, ошибок {failed}'))
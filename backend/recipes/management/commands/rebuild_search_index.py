@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+# noqa I004
+from recipes import search
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ' Полное перестроение поискового индекса рецептов. '
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        with transaction.atomic():
+            backend.index()
+        self.stdout.write(self.style.SUCCESS(
+            f'- {type(backend).__name__}: проиндексировано '
+            f'{Recipe.objects.count()} рецептов'))
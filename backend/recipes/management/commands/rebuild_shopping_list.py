@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+# noqa I004
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = ' Пересоздание и проверка сводных списков покупок. '
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сравнить списки покупок с текущим составом корзин',
+        )
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            ShoppingListItem.objects.rebuild()
+            self.stdout.write(self.style.SUCCESS(
+                '- списки покупок пересозданы'))
+        expected = ShoppingListItem.objects.live_totals()
+        actual = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'amount')
+        }
+        mismatches = [
+            (key, actual.get(key), expected.get(key))
+            for key in expected.keys() | actual.keys()
+            if actual.get(key) != expected.get(key)
+        ]
+        for (user_id, ingredient_id), stored, live in mismatches:
+            self.stdout.write(self.style.WARNING(
+                f'пользователь {user_id}, ингредиент {ingredient_id}: '
+                f'в списке {stored}, в корзине {live}'))
+        if mismatches:
+            self.stdout.write(self.style.ERROR(
+                f'- расхождений: {len(mismatches)}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'- проверено {len(expected)} записей, расхождений нет'))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+# noqa I004
+from recipes.models import Favorite, Recipe
+from users.models import CustomUser, Follow
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (CustomUser, 'recipes_count', Recipe, 'author'),
+    (CustomUser, 'followers_count', Follow, 'author'),
+)
+
+
+class Command(BaseCommand):
+    help = ' Сверка и исправление счетчиков рецептов, избранного и подписок. '
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, не исправляя их',
+        )
+
+    def handle(self, *args, **options):
+        for model, field, related_model, related_field in COUNTERS:
+            actual = Coalesce(Subquery(
+                related_model.objects.filter(
+                    **{related_field: OuterRef('pk')}
+                ).order_by().values(related_field).annotate(
+                    total=Count('pk')
+                ).values('total')
+            ), 0)
+            drifted = model.objects.annotate(actual=actual).filter(
+                ~Q(**{field: F('actual')}))
+            updated = drifted.count()
+            if not options['dry_run'] and updated:
+                model.objects.filter(
+                    pk__in=drifted.values('pk')
+                ).update(**{field: actual})
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.verbose_name_plural}.{field}: '
+                f'расхождений {updated}'))
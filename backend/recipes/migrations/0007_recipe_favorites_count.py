@@ -0,0 +1,35 @@
+# Generated by Django 4.1.7 on 2026-10-18 06:22
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    CustomUser = apps.get_model('users', 'CustomUser')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(favorites_count=Coalesce(models.Subquery(
+        Favorite.objects.filter(recipe=models.OuterRef('pk')).order_by()
+        .values('recipe').annotate(total=models.Count('pk')).values('total')
+    ), 0))
+    CustomUser.objects.update(recipes_count=Coalesce(models.Subquery(
+        Recipe.objects.filter(author=models.OuterRef('pk')).order_by()
+        .values('author').annotate(total=models.Count('pk')).values('total')
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_shoppinglistitem'),
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='Добавлено в избранное'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
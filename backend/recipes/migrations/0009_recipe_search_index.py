@@ -0,0 +1,76 @@
+# Generated by Django 4.1.7 on 2026-10-18 06:33
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+POSTGRES_CREATE = (
+    'CREATE INDEX recipes_recipe_search_vector_gin '
+    'ON recipes_recipe USING gin (search_vector)',
+    "UPDATE recipes_recipe r SET search_vector = "
+    "setweight(to_tsvector(%(config)s, r.name), 'A') || "
+    "setweight(to_tsvector(%(config)s, COALESCE(("
+    "SELECT string_agg(i.name, ' ') FROM recipes_ingredientinrecipe ir "
+    "JOIN recipes_ingredient i ON i.id = ir.ingredient_id "
+    "WHERE ir.recipe_id = r.id), '')), 'B') || "
+    "setweight(to_tsvector(%(config)s, r.text), 'C')",
+)
+POSTGRES_DROP = (
+    'DROP INDEX IF EXISTS recipes_recipe_search_vector_gin',
+)
+SQLITE_CREATE = (
+    'CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5('
+    'name, ingredients, text, tokenize = "unicode61")',
+    "INSERT INTO recipes_recipe_fts (rowid, name, ingredients, text) "
+    "SELECT r.id, r.name, COALESCE(("
+    "SELECT group_concat(i.name, ' ') FROM recipes_ingredientinrecipe ir "
+    "JOIN recipes_ingredient i ON i.id = ir.ingredient_id "
+    "WHERE ir.recipe_id = r.id), ''), r.text FROM recipes_recipe r",
+)
+SQLITE_DROP = (
+    'DROP TABLE IF EXISTS recipes_recipe_fts',
+)
+
+
+def create_search_index(apps, schema_editor):
+    """ Индекс GIN для PostgreSQL или таблица FTS5 для SQLite. """
+    from django.conf import settings
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        params = {'config': settings.SEARCH_CONFIG}
+        with connection.cursor() as cursor:
+            for sql in POSTGRES_CREATE:
+                cursor.execute(sql, params)
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA compile_options')
+            if 'ENABLE_FTS5' not in {row[0] for row in cursor.fetchall()}:
+                return
+            for sql in SQLITE_CREATE:
+                cursor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    statements = {
+        'postgresql': POSTGRES_DROP,
+        'sqlite': SQLITE_DROP,
+    }.get(connection.vendor, ())
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_image_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый индекс'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
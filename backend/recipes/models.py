@@ -18,11 +18,19 @@ Models:
     Cart:
         Модель для связи Recipe и User. Определяет рецепты в списке покупок
         пользователя.
+    ShoppingListItem:
+        Сводный список покупок пользователя: суммарное количество каждого
+        ингредиента из рецептов в Cart.
+    RecipeNeighbor:
+        Похожие рецепты, рассчитанные командой build_recommendations.
 """
 from colorfield.fields import ColorField
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Prefetch, Sum, Window
+from django.db.models.functions import RowNumber
 
 
 class Ingredient(models.Model):
@@ -100,6 +108,55 @@ class Tag(models.Model):
         return f'{self.name} (цвет: {self.color})'
 
 
+class RecipeQuerySet(models.QuerySet):
+    """ QuerySet для модели Recipe. """
+
+    def with_related(self):
+        """ Предзагрузка связанных объектов.
+
+        Автор загружается в том же запросе, теги и ингредиенты -
+        отдельными запросами на всю выборку. Количество запросов
+        не зависит от размера страницы. Флаги избранного, списка покупок
+        и подписки на автора проверяются по api.viewer.ViewerState.
+        """
+        return self.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredient',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'),
+            ),
+        )
+
+    def first_by_author(self, author_ids, limit):
+        """ Не больше limit рецептов каждого автора в порядке модели
+        (Meta.ordering), как author.recipes.all()[:limit].
+
+        Один запрос: рецепты нумеруются оконной функцией ROW_NUMBER()
+        в пределах автора, отбор по номеру - во внешнем запросе.
+        """
+        if not author_ids:
+            # Пустой IN не компилируется в SQL (EmptyResultSet).
+            return self.none()
+        order_by = [
+            F(field[1:]).desc() if field.startswith('-') else F(field).asc()
+            for field in (*self.model._meta.ordering, 'pk')
+        ]
+        ranked = self.filter(author_id__in=author_ids).annotate(
+            row_number=Window(
+                RowNumber(),
+                partition_by=F('author_id'),
+                order_by=order_by,
+            ),
+        ).order_by()
+        sql, params = ranked.query.sql_with_params()
+        return self.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE row_number <= %s '
+            f'ORDER BY author_id, row_number',
+            (*params, limit),
+        )
+
+
 class Recipe(models.Model):
     """ Рецепты.
 
@@ -125,6 +182,17 @@ class Recipe(models.Model):
         cooking_time(int):
             Время приготовления рецепта.
             Ограничение по минимальному значению (1).
+        favorites_count(int):
+            Число добавлений рецепта в избранное.
+        image_versions(dict):
+            Уменьшенные копии изображения в WebP, заполняются
+            фоновой обработкой (recipes.images).
+        search_vector(str):
+            Документ полнотекстового поиска для PostgreSQL
+            (recipes.search).
+        neighbors_outdated(bool):
+            Похожие рецепты требуют пересчета после изменения рецепта
+            или его добавления в избранное.
     """
     author = models.ForeignKey(
         verbose_name='Автор рецепта',
@@ -162,6 +230,30 @@ class Recipe(models.Model):
                         'Минимальное время приготовления 1 минута'},
         default=1,
     )
+    favorites_count = models.PositiveIntegerField(
+        'Добавлено в избранное',
+        default=0,
+        db_index=True,
+    )
+    image_versions = models.JSONField(
+        'Копии изображения',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
+    search_vector = SearchVectorField(
+        'Поисковый индекс',
+        null=True,
+        editable=False,
+    )
+    neighbors_outdated = models.BooleanField(
+        'Требуется пересчет похожих рецептов',
+        default=True,
+        db_index=True,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
@@ -289,3 +381,203 @@ class Cart(FavoriteCartAbstractModel):
             fields=['recipe', 'user'],
             name='unique_recipe_in_cart')
         ]
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+    """ QuerySet для модели ShoppingListItem.
+
+    Список покупок изменяется на разницу количеств ингредиентов при
+    добавлении и удалении рецептов из Cart, при изменении ингредиентов
+    рецепта и при удалении рецепта, без повторной агрегации всей корзины.
+    Изменения учитывают обработчики сигналов моделей (recipes.signals),
+    поэтому список поддерживается и при изменениях через админку.
+    """
+
+    @staticmethod
+    def recipe_amounts(recipe):
+        """ Количество каждого ингредиента в рецепте. """
+        return dict(IngredientInRecipe.objects.filter(
+            recipe=recipe).values_list('ingredient_id', 'amount'))
+
+    def locked_items(self, user_ids, ingredient_ids):
+        """ Записи списков покупок, заблокированные до конца транзакции. """
+        return {
+            (item.user_id, item.ingredient_id): item
+            for item in self.select_for_update().filter(
+                user_id__in=user_ids, ingredient_id__in=ingredient_ids)
+        }
+
+    def apply_deltas(self, user_ids, deltas):
+        """ Изменяет количество ингредиентов в списках пользователей. """
+        deltas = {pk: delta for pk, delta in deltas.items() if delta}
+        if not user_ids or not deltas:
+            return
+        with transaction.atomic():
+            items = self.locked_items(user_ids, deltas)
+            missing = [
+                (user_id, pk) for user_id in user_ids
+                for pk, delta in deltas.items()
+                if delta > 0 and (user_id, pk) not in items
+            ]
+            if missing:
+                # Запись той же пары может одновременно создать другой
+                # запрос: вставка без ошибки дождется его фиксации,
+                # и количество прибавится к уже сохраненному.
+                self.bulk_create(
+                    (self.model(user_id=user_id, ingredient_id=pk, amount=0)
+                     for user_id, pk in missing),
+                    ignore_conflicts=True,
+                )
+                items.update(self.locked_items(
+                    {user_id for user_id, _ in missing},
+                    {pk for _, pk in missing},
+                ))
+            to_update, to_delete = [], []
+            for (_, ingredient_id), item in items.items():
+                item.amount += deltas[ingredient_id]
+                if item.amount > 0:
+                    to_update.append(item)
+                else:
+                    to_delete.append(item.pk)
+            self.bulk_update(to_update, ('amount',))
+            self.filter(pk__in=to_delete).delete()
+
+    def add_recipe(self, user_id, recipe):
+        """ Добавляет ингредиенты рецепта в список покупок. """
+        self.apply_deltas([user_id], self.recipe_amounts(recipe))
+
+    def remove_recipe(self, user_id, recipe):
+        """ Убирает ингредиенты рецепта из списка покупок. """
+        self.apply_deltas([user_id], {
+            pk: -amount for pk, amount in self.recipe_amounts(recipe).items()
+        })
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        """ Учитывает изменение ингредиентов рецепта в списках покупок
+        всех пользователей, добавивших рецепт в Cart.
+        """
+        deltas = {
+            pk: new_amounts.get(pk, 0) - old_amounts.get(pk, 0)
+            for pk in old_amounts.keys() | new_amounts.keys()
+            if new_amounts.get(pk, 0) != old_amounts.get(pk, 0)
+        }
+        if deltas:
+            self.apply_deltas(list(Cart.objects.filter(
+                recipe=recipe).values_list('user_id', flat=True)), deltas)
+
+    @staticmethod
+    def live_totals():
+        """ Список покупок, агрегированный по текущему составу Cart. """
+        return {
+            (row['recipe__carts__user'], row['ingredient']): row['total']
+            for row in IngredientInRecipe.objects.filter(
+                recipe__carts__isnull=False,
+            ).order_by().values(
+                'recipe__carts__user', 'ingredient',
+            ).annotate(total=Sum('amount'))
+        }
+
+    def rebuild(self):
+        """ Пересоздает списки покупок всех пользователей. """
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create(
+                (self.model(user_id=user_id, ingredient_id=ingredient_id,
+                            amount=amount)
+                 for (user_id, ingredient_id), amount
+                 in self.live_totals().items()),
+                batch_size=settings.BULK_BATCH_SIZE,
+            )
+
+
+class ShoppingListItem(models.Model):
+    """ Сводный список покупок пользователя.
+    Поддерживается при изменении Cart и ингредиентов рецептов.
+
+    Attributes:
+        user(int):
+            Пользователь.
+            Связь ForeignKey с моделью User.
+        ingredient(int):
+            Ингредиент.
+            Связь ForeignKey с моделью Ingredient.
+        amount(int):
+            Суммарное количество ингредиента в рецептах из Cart.
+    """
+    user = models.ForeignKey(
+        verbose_name='Пользователь',
+        related_name='shopping_list',
+        to=settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    ingredient = models.ForeignKey(
+        verbose_name='Ингредиент',
+        related_name='shopping_list_items',
+        to=Ingredient,
+        on_delete=models.CASCADE,
+    )
+    amount = models.PositiveIntegerField(
+        'Суммарное количество ингредиента',
+    )
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списке покупок'
+        ordering = ('user', 'ingredient',)
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'ingredient'],
+            name='unique_ingredient_in_shopping_list')
+        ]
+
+    def __str__(self):
+        return f'{self.amount} {self.ingredient} в списке {self.user}'
+
+
+class RecipeNeighbor(models.Model):
+    """ Похожий рецепт.
+    Заполняется командой build_recommendations.
+
+    Attributes:
+        recipe(int):
+            Рецепт.
+            Связь ForeignKey с моделью Recipe.
+        neighbor(int):
+            Похожий рецепт.
+            Связь ForeignKey с моделью Recipe.
+        score(float):
+            Косинусная близость рецептов по ингредиентам, тегам
+            и пользователям, добавившим рецепты в избранное.
+    """
+    recipe = models.ForeignKey(
+        verbose_name='Рецепт',
+        related_name='neighbors',
+        to=Recipe,
+        on_delete=models.CASCADE,
+    )
+    neighbor = models.ForeignKey(
+        verbose_name='Похожий рецепт',
+        related_name='similar_to',
+        to=Recipe,
+        on_delete=models.CASCADE,
+    )
+    score = models.FloatField(
+        'Близость',
+    )
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        ordering = ('recipe', '-score',)
+        constraints = [models.UniqueConstraint(
+            fields=['recipe', 'neighbor'],
+            name='unique_recipe_neighbor')
+        ]
+        indexes = [models.Index(
+            fields=['recipe', '-score'],
+            name='recipe_neighbor_score_idx')
+        ]
+
+    def __str__(self):
+        return f'{self.neighbor} похож на {self.recipe}'
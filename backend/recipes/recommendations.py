@@ -0,0 +1,233 @@
+""" Расчет похожих рецептов для команды build_recommendations.
+
+Рецепт описывается тремя разреженными векторами признаков: ингредиенты
+(с весами IDF), теги и пользователи, добавившие рецепт в избранное.
+Близость рецептов - взвешенная сумма косинусных близостей по каждой
+группе признаков с весами RECOMMENDATION_WEIGHTS.
+
+Кандидаты в похожие рецепты находятся произведением разреженных матриц
+ингредиентов и избранного для блока строк. Теги и частые ингредиенты
+(в доле рецептов больше RECOMMENDATION_MAX_DF, но не меньше чем
+в RECOMMENDATION_MIN_COMMON рецептах) есть у многих рецептов и
+дали бы почти плотное произведение, поэтому их вклад в близость
+добавляется только к найденным кандидатам. Для каждого рецепта
+сохраняются RECOMMENDATION_TOP_K рецептов с наибольшей близостью.
+"""
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from scipy import sparse
+
+from .models import Favorite, IngredientInRecipe, Recipe, RecipeNeighbor
+
+PAIRS_CHUNK_SIZE = 2 ** 16
+
+
+def incidence(rows, columns, shape):
+    """ Матрица 0/1 по парам (строка, столбец). """
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, columns)),
+        shape=shape,
+    )
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix
+
+
+def normalize(matrix):
+    """ Нормирует строки матрицы по L2. """
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags((1 / norms).astype(np.float32)) @ matrix
+
+
+def idf(matrix):
+    """ Взвешивает столбцы по обратной частоте: общие ингредиенты
+    (соль, вода) меньше влияют на близость.
+    """
+    documents = np.asarray((matrix > 0).sum(axis=0)).ravel()
+    weights = np.log((1 + matrix.shape[0]) / (1 + documents)) + 1
+    return matrix @ sparse.diags(weights.astype(np.float32))
+
+
+class Features:
+    """ Признаки рецептов.
+
+    Признаки каждой группы нормированы и умножены на корень веса группы,
+    поэтому скалярное произведение строк равно взвешенной близости.
+
+    Attributes:
+        candidates:
+            Разреженные признаки: редкие ингредиенты и избранное.
+        common:
+            Признаки, общие для многих рецептов: частые ингредиенты
+            и теги.
+    """
+
+    def __init__(self, ingredients, favorites, tags):
+        weights = settings.RECOMMENDATION_WEIGHTS
+        documents = np.asarray((ingredients > 0).sum(axis=0)).ravel()
+        # В небольшом каталоге доля дала бы порог меньше одного рецепта,
+        # и все ингредиенты считались бы частыми.
+        common = documents > max(
+            settings.RECOMMENDATION_MAX_DF * ingredients.shape[0],
+            settings.RECOMMENDATION_MIN_COMMON,
+        )
+        ingredients = (normalize(idf(ingredients)) * np.sqrt(
+            weights['ingredients'])).tocsc()
+        self.candidates = sparse.hstack((
+            ingredients[:, ~common],
+            normalize(favorites) * np.sqrt(weights['favorites']),
+        ), format='csr', dtype=np.float32)
+        self.candidates_t = self.candidates.T.tocsr()
+        self.common = sparse.hstack((
+            ingredients[:, common],
+            normalize(tags) * np.sqrt(weights['tags']),
+        ), format='csr', dtype=np.float32)
+
+    def top_neighbors(self, rows, top_k, batch_size):
+        """ Для каждой строки из rows - индексы и близость top_k
+        похожих строк, по убыванию близости.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            scores = (self.candidates[batch] @ self.candidates_t).tocsr()
+            pairs = np.repeat(
+                np.arange(len(batch)), np.diff(scores.indptr))
+            rows_of_pairs = batch[pairs]
+            for begin in range(0, len(pairs), PAIRS_CHUNK_SIZE):
+                end = begin + PAIRS_CHUNK_SIZE
+                scores.data[begin:end] += np.asarray(
+                    self.common[rows_of_pairs[begin:end]].multiply(
+                        self.common[scores.indices[begin:end]]
+                    ).sum(axis=1)).ravel()
+            scores.data[scores.indices == rows_of_pairs] = -np.inf
+            for position, row in enumerate(batch):
+                begin, end = scores.indptr[position:position + 2]
+                data = scores.data[begin:end]
+                columns = scores.indices[begin:end]
+                if len(data) > top_k:
+                    best = np.argpartition(-data, top_k)[:top_k]
+                    data, columns = data[best], columns[best]
+                order = np.argsort(-data, kind='stable')
+                data, columns = data[order], columns[order]
+                valid = np.isfinite(data)
+                yield row, columns[valid], data[valid]
+
+
+def pairs(queryset, recipe_ids):
+    """ Матрица рецепт x объект по парам (id рецепта, id объекта). """
+    data = np.array(
+        list(queryset.iterator(chunk_size=settings.BULK_BATCH_SIZE)),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    data = data[np.isin(data[:, 0], recipe_ids)]
+    rows = np.searchsorted(recipe_ids, data[:, 0])
+    columns, inverse = np.unique(data[:, 1], return_inverse=True)
+    return incidence(rows, inverse, (len(recipe_ids), len(columns)))
+
+
+def load_features():
+    """ id рецептов и их признаки из БД. """
+    recipe_ids = np.array(
+        Recipe.objects.order_by('id').values_list('id', flat=True),
+        dtype=np.int64,
+    )
+    features = Features(
+        pairs(IngredientInRecipe.objects.order_by().values_list(
+            'recipe_id', 'ingredient_id'), recipe_ids),
+        pairs(Favorite.objects.order_by().values_list(
+            'recipe_id', 'user_id'), recipe_ids),
+        pairs(Recipe.tags.through.objects.order_by().values_list(
+            'recipe_id', 'tag_id'), recipe_ids),
+    )
+    return recipe_ids, features
+
+
+def synthetic_features(recipes, ingredients=2000, per_recipe=8, users=None,
+                       favorites_per_user=20, tags=3, random_seed=42):
+    """ Случайные признаки для оценки времени и памяти расчета.
+
+    Популярность ингредиентов и рецептов убывает по закону Ципфа.
+    """
+    rng = np.random.default_rng(random_seed)
+    users = users or max(recipes // 10, 1)
+
+    def zipf(size, count):
+        weights = 1 / np.arange(10, size + 10)
+        return rng.choice(size, count, p=weights / weights.sum())
+
+    rows = np.repeat(np.arange(recipes), per_recipe)
+    favorite_rows = zipf(recipes, users * favorites_per_user)
+    return Features(
+        incidence(rows, zipf(ingredients, len(rows)),
+                  (recipes, ingredients)),
+        incidence(favorite_rows,
+                  np.repeat(np.arange(users), favorites_per_user),
+                  (recipes, users)),
+        incidence(np.arange(recipes), rng.integers(0, tags, recipes),
+                  (recipes, tags)),
+    )
+
+
+def save_neighbors(recipe_ids, neighbors, replace=True):
+    """ Сохраняет похожие рецепты, с replace - удаляя прежние. """
+    batch_size = settings.BULK_BATCH_SIZE
+    for start in range(0, len(neighbors), batch_size):
+        batch = neighbors[start:start + batch_size]
+        if replace:
+            RecipeNeighbor.objects.filter(recipe_id__in=[
+                int(recipe_ids[row]) for row, _, _ in batch]).delete()
+        RecipeNeighbor.objects.bulk_create(
+            (RecipeNeighbor(recipe_id=int(recipe_ids[row]),
+                            neighbor_id=int(recipe_ids[column]),
+                            score=float(score))
+             for row, columns, scores in batch
+             for column, score in zip(columns, scores)),
+            batch_size=batch_size,
+        )
+
+
+def build(full=False, top_k=None, batch_size=None):
+    """ Пересчитывает похожие рецепты.
+
+    Без full пересчитываются только рецепты с neighbors_outdated,
+    рецепты, в списках которых они были, и их новые похожие рецепты.
+    Возвращает число пересчитанных рецептов.
+    """
+    top_k = top_k or settings.RECOMMENDATION_TOP_K
+    batch_size = batch_size or settings.RECOMMENDATION_BATCH_SIZE
+    outdated = np.array(Recipe.objects.filter(
+        neighbors_outdated=True).values_list('id', flat=True), dtype=np.int64)
+    if not full and not len(outdated):
+        return 0
+    recipe_ids, features = load_features()
+    outdated = outdated[np.isin(outdated, recipe_ids)]
+
+    if full:
+        neighbors = list(features.top_neighbors(
+            np.arange(len(recipe_ids)), top_k, batch_size))
+    else:
+        neighbors = list(features.top_neighbors(
+            np.searchsorted(recipe_ids, outdated), top_k, batch_size))
+        affected = np.array(RecipeNeighbor.objects.filter(
+            neighbor_id__in=outdated.tolist()
+        ).values_list('recipe_id', flat=True), dtype=np.int64)
+        affected = np.searchsorted(
+            recipe_ids, affected[np.isin(affected, recipe_ids)])
+        affected = set(affected.tolist()).union(*(
+            columns.tolist() for _, columns, _ in neighbors
+        )) - {row for row, _, _ in neighbors}
+        neighbors += features.top_neighbors(
+            sorted(affected), top_k, batch_size)
+
+    with transaction.atomic():
+        if full:
+            RecipeNeighbor.objects.all().delete()
+        save_neighbors(recipe_ids, neighbors, replace=not full)
+        for start in range(0, len(outdated), settings.BULK_BATCH_SIZE):
+            Recipe.objects.filter(pk__in=outdated[
+                start:start + settings.BULK_BATCH_SIZE].tolist()
+            ).update(neighbors_outdated=False)
+    return len(neighbors)
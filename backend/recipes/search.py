@@ -0,0 +1,199 @@
+""" Полнотекстовый поиск рецептов по названию, ингредиентам и описанию.
+
+Индекс зависит от СУБД:
+    PostgreSQL:
+        поле Recipe.search_vector с индексом GIN, ранжирование
+        SearchRank. Название весомее ингредиентов, ингредиенты весомее
+        описания.
+    SQLite:
+        таблица FTS5 recipes_recipe_fts с теми же полями, ранжирование
+        bm25 с теми же весами.
+    Прочие СУБД:
+        поиск по вхождению без индекса.
+
+Индекс обновляется после сохранения и удаления рецептов (recipes.signals),
+полностью перестраивается командой rebuild_search_index.
+"""
+import re
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import DatabaseError, connection
+from django.db.models import (Case, F, IntegerField, OuterRef, Q, Subquery,
+                              Value, When)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+
+from .models import Ingredient, IngredientInRecipe, Recipe
+
+FTS_TABLE = 'recipes_recipe_fts'
+FTS_WEIGHTS = (10.0, 5.0, 1.0)
+BATCH_SIZE = 500
+
+fts5_tables = {}
+
+
+class SearchBackend:
+    """ Поиск по вхождению, используется без поддержки индекса. """
+
+    def index(self, recipe_ids=None):
+        """ Обновляет индекс рецептов, без recipe_ids - всех рецептов. """
+
+    def remove(self, recipe_ids):
+        """ Удаляет рецепты из индекса. """
+
+    def search(self, queryset, query):
+        """ Рецепты, подходящие под запрос, с рангом в search_rank. """
+        matches = Recipe.objects.filter(
+            Q(name__icontains=query)
+            | Q(text__icontains=query)
+            | Q(ingredients__name__icontains=query)
+        ).values('pk')
+        return queryset.filter(pk__in=matches).annotate(search_rank=Case(
+            When(name__icontains=query, then=2),
+            default=1,
+            output_field=IntegerField(),
+        ))
+
+
+class PostgresSearchBackend(SearchBackend):
+    """ Поиск по полю Recipe.search_vector. """
+
+    def document(self):
+        """ Выражение tsvector рецепта. """
+        ingredients = Subquery(
+            IngredientInRecipe.objects.filter(
+                recipe=OuterRef('pk')
+            ).order_by().values('recipe').annotate(
+                names=StringAgg('ingredient__name', ' ')
+            ).values('names')
+        )
+        config = settings.SEARCH_CONFIG
+        return (
+            SearchVector('name', weight='A', config=config)
+            + SearchVector(Coalesce(ingredients, Value('')),
+                           weight='B', config=config)
+            + SearchVector('text', weight='C', config=config)
+        )
+
+    def index(self, recipe_ids=None):
+        recipes = Recipe.objects.all()
+        if recipe_ids is not None:
+            recipes = recipes.filter(pk__in=recipe_ids)
+        recipes.update(search_vector=self.document())
+
+    def search(self, queryset, query):
+        query = SearchQuery(
+            query, config=settings.SEARCH_CONFIG, search_type='websearch')
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query))
+
+
+class SqliteSearchBackend(SearchBackend):
+    """ Поиск по таблице FTS5. """
+
+    @staticmethod
+    def match(query):
+        """ Запрос FTS5: все слова запроса как префиксы. """
+        return ' '.join(
+            '"{}"*'.format(word) for word in re.findall(r'\w+', query))
+
+    @staticmethod
+    def insert_sql(where=''):
+        ingredient_in_recipe = IngredientInRecipe._meta.db_table
+        ingredient = Ingredient._meta.db_table
+        recipe = Recipe._meta.db_table
+        return (
+            f'INSERT INTO {FTS_TABLE} (rowid, name, ingredients, text) '
+            f'SELECT r.id, r.name, COALESCE(('
+            f'SELECT group_concat(i.name, \' \') '
+            f'FROM {ingredient_in_recipe} ir '
+            f'JOIN {ingredient} i ON i.id = ir.ingredient_id '
+            f'WHERE ir.recipe_id = r.id), \'\'), r.text '
+            f'FROM {recipe} r {where}'
+        )
+
+    @staticmethod
+    def batches(recipe_ids):
+        """ Части списка id и плейсхолдеры для них. """
+        recipe_ids = list(recipe_ids)
+        for start in range(0, len(recipe_ids), BATCH_SIZE):
+            batch = recipe_ids[start:start + BATCH_SIZE]
+            yield batch, ', '.join(['%s'] * len(batch))
+
+    def index(self, recipe_ids=None):
+        with connection.cursor() as cursor:
+            if recipe_ids is None:
+                cursor.execute(f'DELETE FROM {FTS_TABLE}')
+                cursor.execute(self.insert_sql())
+                return
+            for batch, placeholders in self.batches(recipe_ids):
+                cursor.execute(
+                    f'DELETE FROM {FTS_TABLE} '
+                    f'WHERE rowid IN ({placeholders})', batch)
+                cursor.execute(self.insert_sql(
+                    f'WHERE r.id IN ({placeholders})'), batch)
+
+    def remove(self, recipe_ids):
+        with connection.cursor() as cursor:
+            for batch, placeholders in self.batches(recipe_ids):
+                cursor.execute(
+                    f'DELETE FROM {FTS_TABLE} '
+                    f'WHERE rowid IN ({placeholders})', batch)
+
+    def search(self, queryset, query):
+        match = self.match(query)
+        if not match:
+            return queryset.annotate(search_rank=Value(0)).none()
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            (match,),
+        )).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s '
+            f'AND rowid = {Recipe._meta.db_table}.id',
+            (match,),
+        ))
+
+
+def fts5_table_exists():
+    """ Таблица FTS5 создана миграцией (SQLite собран с FTS5).
+    Результат проверки запоминается для каждой базы.
+    """
+    name = connection.settings_dict['NAME']
+    if name not in fts5_tables:
+        try:
+            fts5_tables[name] = (
+                FTS_TABLE in connection.introspection.table_names())
+        except DatabaseError:
+            return False
+    return fts5_tables[name]
+
+
+def get_backend():
+    """ Реализация поиска для текущей СУБД. """
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    if connection.vendor == 'sqlite' and fts5_table_exists():
+        return SqliteSearchBackend()
+    return SearchBackend()
+
+
+def search(queryset, query):
+    """ Рецепты queryset, подходящие под запрос, по убыванию релевантности.
+    """
+    return get_backend().search(queryset, query).order_by(
+        '-search_rank', 'pk')
+
+
+def index(recipe_ids=None):
+    """ Обновляет индекс рецептов. """
+    get_backend().index(recipe_ids)
+
+
+def remove(recipe_ids):
+    """ Удаляет рецепты из индекса. """
+    get_backend().remove(recipe_ids)
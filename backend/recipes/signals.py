@@ -0,0 +1,178 @@
+""" Сигналы и их обработчики приложения `recipes`.
+
+Signals:
+    data_loaded:
+        Отправляется после массовой загрузки данных модели в обход
+        post_save (bulk_create, COPY). sender - класс модели.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import Signal, receiver
+# noqa I004
+from foodgram.metrics import OBJECTS_CREATED  # noqa I001
+
+from . import images, search
+from .indexes import ingredient_index, recipe_ingredient_index
+from .models import (Cart, Favorite, Ingredient, IngredientInRecipe, Recipe,
+                     ShoppingListItem)
+
+data_loaded = Signal()
+
+# Рецепты, для которых списки покупок уже изменены в текущем контексте:
+# удаление их Cart и IngredientInRecipe не учитывается повторно.
+accounted_recipes = ContextVar('accounted_recipes', default=frozenset())
+
+
+@contextmanager
+def shopping_lists_accounted(recipe_id):
+    """ Удаление Cart и IngredientInRecipe рецепта внутри блока
+    не изменяет списки покупок: изменения учтены вызывающим кодом.
+    """
+    token = accounted_recipes.set(accounted_recipes.get() | {recipe_id})
+    try:
+        yield
+    finally:
+        accounted_recipes.reset(token)
+
+
+@receiver((post_save, post_delete, data_loaded), sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    """ Сбрасывает индекс поиска ингредиентов после фиксации транзакции:
+    до нее процесс построил бы индекс по прежним данным с новой версией.
+    """
+    transaction.on_commit(ingredient_index.invalidate)
+
+
+@receiver(post_save, sender=Recipe)
+def schedule_image_processing(sender, instance, **kwargs):
+    """ Запускает обработку нового или замененного изображения. """
+    if instance.image and not images.is_current(instance):
+        images.schedule(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe(sender, instance, **kwargs):
+    """ Обновляет поисковый индекс рецепта после фиксации транзакции,
+    когда ингредиенты рецепта уже сохранены.
+    """
+    recipe_id = instance.pk
+    transaction.on_commit(lambda: search.index([recipe_id]))
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_index(sender, instance, **kwargs):
+    """ Удаляет рецепт из поискового индекса. """
+    search.remove([instance.pk])
+
+
+@receiver(post_save, sender=Ingredient)
+def index_ingredient_recipes(sender, instance, created, **kwargs):
+    """ Переиндексирует рецепты при изменении названия ингредиента. """
+    if created:
+        return
+    recipe_ids = list(instance.recipes.values_list('id', flat=True))
+    if recipe_ids:
+        transaction.on_commit(lambda: search.index(recipe_ids))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def update_recipe_ingredient_index(sender, instance, **kwargs):
+    """ Обновляет обратный индекс ингредиентов после фиксации транзакции.
+    """
+    recipe_id = instance.pk
+    transaction.on_commit(
+        lambda: recipe_ingredient_index.invalidate([recipe_id]))
+
+
+@receiver(pre_save, sender=Recipe)
+def mark_neighbors_outdated(sender, instance, **kwargs):
+    """ Похожие рецепты пересчитываются после изменения рецепта. """
+    instance.neighbors_outdated = True
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Cart)
+def count_created(sender, created, **kwargs):
+    """ Счетчики созданных объектов для метрик. """
+    if created:
+        OBJECTS_CREATED.labels(sender._meta.model_name).inc()
+
+
+def saved_values(model, instance, fields):
+    """ Значения полей сохраненной записи или None для новой. """
+    if instance._state.adding:
+        return None
+    return model.objects.filter(pk=instance.pk).values_list(
+        *fields).first()
+
+
+@receiver(pre_save, sender=Cart)
+def remember_cart(sender, instance, **kwargs):
+    """ Запоминает пользователя и рецепт до изменения записи. """
+    instance.saved_values = saved_values(sender, instance, ('user', 'recipe'))
+
+
+@receiver(post_save, sender=Cart)
+def add_cart_to_shopping_list(sender, instance, **kwargs):
+    """ Добавляет ингредиенты рецепта в список покупок. """
+    saved = getattr(instance, 'saved_values', None)
+    if saved == (instance.user_id, instance.recipe_id):
+        return
+    if saved is not None:
+        ShoppingListItem.objects.remove_recipe(*saved)
+    ShoppingListItem.objects.add_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_delete, sender=Cart)
+def remove_cart_from_shopping_list(sender, instance, **kwargs):
+    """ Убирает ингредиенты рецепта из списка покупок. """
+    if instance.recipe_id not in accounted_recipes.get():
+        ShoppingListItem.objects.remove_recipe(
+            instance.user_id, instance.recipe_id)
+
+
+@receiver(pre_save, sender=IngredientInRecipe)
+def remember_ingredient_in_recipe(sender, instance, **kwargs):
+    """ Запоминает ингредиент и количество до изменения записи. """
+    instance.saved_values = saved_values(
+        sender, instance, ('ingredient', 'amount'))
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+def change_shopping_lists(sender, instance, **kwargs):
+    """ Учитывает изменение ингредиента рецепта в списках покупок. """
+    saved = getattr(instance, 'saved_values', None)
+    ShoppingListItem.objects.change_recipe(
+        instance.recipe_id,
+        dict([saved]) if saved is not None else {},
+        {instance.ingredient_id: instance.amount},
+    )
+
+
+@receiver(post_delete, sender=IngredientInRecipe)
+def remove_ingredient_from_shopping_lists(sender, instance, **kwargs):
+    """ Убирает удаленный ингредиент рецепта из списков покупок. """
+    if instance.recipe_id not in accounted_recipes.get():
+        ShoppingListItem.objects.change_recipe(
+            instance.recipe_id, {instance.ingredient_id: instance.amount}, {})
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(sender, instance, **kwargs):
+    """ Убирает ингредиенты удаляемого рецепта из списков покупок
+    пользователей, добавивших его в Cart.
+    """
+    ShoppingListItem.objects.change_recipe(
+        instance, ShoppingListItem.objects.recipe_amounts(instance), {})
+    accounted_recipes.set(accounted_recipes.get() | {instance.pk})
+
+
+@receiver(post_delete, sender=Recipe)
+def forget_deleted_recipe(sender, instance, **kwargs):
+    """ Рецепт удален вместе с Cart и IngredientInRecipe. """
+    accounted_recipes.set(accounted_recipes.get() - {instance.pk})
@@ -11,13 +11,16 @@ class UserAdmin(admin.ModelAdmin):
     search_fields = ('email', 'username',)
     list_filter = ('email', 'username',)
     ordering = ('username',)
+    readonly_fields = ('recipes_count', 'followers_count',)
 
-    @admin.display(description='Количество рецептов')
+    @admin.display(description='Количество рецептов',
+                   ordering='recipes_count')
     def count_recipes(self, user):
-        """ Считает количество рецептов у пользователя. """
-        return user.recipes.count()
+        """ Количество рецептов у пользователя. """
+        return user.recipes_count
 
-    @admin.display(description='Количество подписчиков')
+    @admin.display(description='Количество подписчиков',
+                   ordering='followers_count')
     def count_following(self, author):
-        """ Считает количество подписчиков у пользователя. """
-        return author.following.count()
+        """ Количество подписчиков у пользователя. """
+        return author.followers_count
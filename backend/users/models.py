@@ -28,6 +28,10 @@ class CustomUser(AbstractUser):
             Ограничение по максимальной длине (150)
         is_active (bool):
             Активен или заблокирован пользователь.
+        recipes_count(int):
+            Количество рецептов пользователя.
+        followers_count(int):
+            Количество подписчиков пользователя.
     """
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name',)
@@ -60,6 +64,14 @@ class CustomUser(AbstractUser):
         max_length=settings.MAX_LEN_USER_ATTR,
         help_text='Укажите пароль',
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+    )
 
     class Meta:
         verbose_name = 'Пользователь'